@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+from flask import g, jsonify
+
+ADMISSION_MEMORY_BUDGET = int(os.getenv('ADMISSION_MEMORY_BUDGET_MB', '1024')) * 1024 * 1024
+# Seconds a request may wait for budget to free up before being rejected
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '5'))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '10'))
+# Reserved before a repository is downloaded, then resized to the estimate once the archive is in
+ADMISSION_DOWNLOAD_ESTIMATE = int(os.getenv('ADMISSION_DOWNLOAD_ESTIMATE_MB', '32')) * 1024 * 1024
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted within the memory budget"""
+
+
+class MemoryBudget:
+    """Per-process accounting of the estimated bytes held by in-flight repository processing"""
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.in_flight_bytes = 0
+        self.in_flight_requests = 0
+        self.peak_bytes = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self._condition = threading.Condition()
+
+    def _fits(self, cost):
+        # A request larger than the whole budget still runs, but only on its own
+        return self.in_flight_bytes + cost <= self.budget_bytes or self.in_flight_requests == 0
+
+    def _fits_growth(self, growth):
+        # Growth of an existing reservation; as above, a request running alone may exceed the budget
+        return growth <= 0 or self.in_flight_bytes + growth <= self.budget_bytes or self.in_flight_requests <= 1
+
+    def acquire(self, cost, timeout=0):
+        """Reserve cost bytes, waiting up to timeout seconds; returns False if the budget stays full"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if not self._fits(cost):
+                self.queued += 1
+                self.waiting += 1
+                try:
+                    while not self._fits(cost):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            return False
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+            self.in_flight_bytes += cost
+            self.in_flight_requests += 1
+            self.peak_bytes = max(self.peak_bytes, self.in_flight_bytes)
+            self.admitted += 1
+            return True
+
+    def resize(self, old_cost, new_cost, timeout=0):
+        """Change an existing reservation, waiting up to timeout seconds for any growth to fit"""
+        growth = new_cost - old_cost
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if not self._fits_growth(growth):
+                self.queued += 1
+                self.waiting += 1
+                try:
+                    while not self._fits_growth(growth):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            return False
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+            self.in_flight_bytes += growth
+            self.peak_bytes = max(self.peak_bytes, self.in_flight_bytes)
+            if growth < 0:
+                self._condition.notify_all()
+            return True
+
+    def release(self, cost):
+        with self._condition:
+            self.in_flight_bytes -= cost
+            self.in_flight_requests -= 1
+            self._condition.notify_all()
+
+    def metrics(self):
+        with self._condition:
+            return {
+                'pid': os.getpid(),
+                'budget_bytes': self.budget_bytes,
+                'in_flight_bytes': self.in_flight_bytes,
+                'in_flight_requests': self.in_flight_requests,
+                'peak_bytes': self.peak_bytes,
+                'waiting_requests': self.waiting,
+                'admitted_total': self.admitted,
+                'queued_total': self.queued,
+                'rejected_total': self.rejected
+            }
+
+
+MEMORY_BUDGET = MemoryBudget(ADMISSION_MEMORY_BUDGET)
+
+
+def admit_request(cost):
+    """
+    Reserve memory budget for the rest of the current Flask request
+
+    The reservation is released by release_request, registered as a teardown handler.
+    Returns False when the request should be turned away.
+    """
+    if not MEMORY_BUDGET.acquire(cost, ADMISSION_QUEUE_TIMEOUT):
+        return False
+    g.setdefault('admission_costs', []).append(cost)
+    return True
+
+
+def admit_download():
+    """Reserve the download estimate before fetching a repository; see resize_request"""
+    return admit_request(ADMISSION_DOWNLOAD_ESTIMATE)
+
+
+def resize_request(cost):
+    """
+    Resize the current request's latest reservation to cost, e.g. once the archive size is known
+
+    Returns False (keeping the old reservation until teardown) when the growth doesn't fit in time.
+    """
+    costs = g.get('admission_costs')
+    if not costs:
+        return admit_request(cost)
+    if not MEMORY_BUDGET.resize(costs[-1], cost, ADMISSION_QUEUE_TIMEOUT):
+        return False
+    costs[-1] = cost
+    return True
+
+
+def release_request(exception=None):
+    for cost in g.pop('admission_costs', []):
+        MEMORY_BUDGET.release(cost)
+
+
+def admission_rejected_response():
+    response = jsonify({'error': 'Server is busy processing other repositories, please retry shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER)
+    return response
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# Seconds between scans of the cache directory when little has been written
+DISK_PRUNE_INTERVAL = 300
+
+
+class ResultCache:
+    """
+    Bounded in-memory LRU cache for JSON-serialisable results, optionally persisted to disk
+
+    The disk copy is bounded too: files unused for max_disk_age seconds are dropped, and
+    once the directory grows past max_disk_bytes the least recently used files are removed.
+    Reads refresh a file's mtime, so mtime order is usage order across all workers.
+
+    Entries in shared_namespaces are overwritten in place rather than keyed by content, so
+    with a cache_dir they are always read from disk: a copy kept in this process's memory
+    would go stale as soon as another worker writes a newer value.
+    """
+
+    def __init__(self, max_entries=10000, cache_dir=None, max_disk_bytes=None, max_disk_age=None,
+                 shared_namespaces=()):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_disk_age = max_disk_age
+        self.shared_namespaces = frozenset(shared_namespaces)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        self._written_since_prune = 0
+        self._last_prune = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _disk_path(self, namespace, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, namespace, f"{digest}.json")
+
+    def _is_shared(self, namespace):
+        return self.cache_dir is not None and namespace in self.shared_namespaces
+
+    def get(self, namespace, key):
+        with self._lock:
+            if (namespace, key) in self._entries:
+                self._entries.move_to_end((namespace, key))
+                self.hits += 1
+                return self._entries[(namespace, key)]
+
+        if self.cache_dir:
+            path = self._disk_path(namespace, key)
+            try:
+                if self.max_disk_age and time.time() - os.path.getmtime(path) > self.max_disk_age:
+                    raise OSError("expired")
+                with open(path, 'r') as f:
+                    value = json.load(f)
+                os.utime(path)
+                if not self._is_shared(namespace):
+                    self._remember(namespace, key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+            except (OSError, ValueError):
+                pass
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, namespace, key, value):
+        with self._lock:
+            self._entries[(namespace, key)] = value
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, namespace, key, value):
+        if not self._is_shared(namespace):
+            self._remember(namespace, key, value)
+
+        if self.cache_dir:
+            path = self._disk_path(namespace, key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(value, f)
+                    size = f.tell()
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Error writing analysis cache: {str(e)}")
+                return
+            self._maybe_prune_disk(size)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+        if self.cache_dir:
+            try:
+                os.remove(self._disk_path(namespace, key))
+            except OSError:
+                pass
+
+    def _maybe_prune_disk(self, written):
+        with self._lock:
+            self._written_since_prune += written
+            due = time.time() - self._last_prune > DISK_PRUNE_INTERVAL or (
+                self.max_disk_bytes and self._written_since_prune > self.max_disk_bytes // 10)
+        if due and (self.max_disk_bytes or self.max_disk_age):
+            self.prune_disk()
+
+    def prune_disk(self):
+        """Remove expired cache files, then the least recently used ones until under max_disk_bytes"""
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                self._written_since_prune = 0
+                self._last_prune = time.time()
+
+            files = []
+            for namespace in os.scandir(self.cache_dir):
+                if not namespace.is_dir():
+                    continue
+                for entry in os.scandir(namespace.path):
+                    if not entry.is_file():
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+
+            now = time.time()
+            total = sum(size for _, size, _ in files)
+            files.sort()
+            for mtime, size, path in files:
+                expired = self.max_disk_age and now - mtime > self.max_disk_age
+                # Prune to 90% of the budget so the next scan isn't triggered straight away
+                over_budget = self.max_disk_bytes and total > self.max_disk_bytes * 0.9
+                if not (expired or over_budget):
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+        except OSError as e:
+            print(f"Error pruning analysis cache: {str(e)}")
+        finally:
+            self._prune_lock.release()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+ANALYSIS_CACHE = ResultCache(
+    max_entries=int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '20000')),
+    cache_dir=os.getenv('ANALYSIS_CACHE_DIR') or None,
+    max_disk_bytes=int(os.getenv('ANALYSIS_CACHE_DIR_MAX_MB', '1024')) * 1024 * 1024,
+    max_disk_age=int(os.getenv('ANALYSIS_CACHE_DIR_MAX_AGE_DAYS', '30')) * 86400,
+    shared_namespaces=('manifest', 'repo_head')
+)
+
+
+def blob_hash(content):
+    """Compute the git blob SHA-1 of a file's text, matching `git hash-object`"""
+    data = content.encode('utf-8')
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def archive_prefix(filenames):
+    """Return the top-level directory shared by every file (the zipball's owner-repo-sha/), if any"""
+    prefixes = {name.split('/', 1)[0] for name in filenames if '/' in name}
+    if len(prefixes) == 1 and all('/' in name for name in filenames):
+        return prefixes.pop() + '/'
+    return ''
+
+
+def build_manifest(file_contents):
+    """Map each file's path (without the archive prefix) to its blob hash"""
+    prefix = archive_prefix(list(file_contents))
+    return {filename[len(prefix):]: blob_hash(content) for filename, content in file_contents.items()}
+
+
+def manifest_digest(manifest):
+    """Stable digest of a whole manifest, used to key whole-repository results"""
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def diff_manifest(old_manifest, new_manifest):
+    """Return the added, modified and removed paths between two manifests"""
+    old_manifest = old_manifest or {}
+    return {
+        'added': sorted(path for path in new_manifest if path not in old_manifest),
+        'modified': sorted(path for path in new_manifest
+                           if path in old_manifest and old_manifest[path] != new_manifest[path]),
+        'removed': sorted(path for path in old_manifest if path not in new_manifest)
+    }
+
+
+def record_manifest(repo_url, manifest, scope='analyze'):
+    """
+    Store the manifest for a repository and diff it against the previously analysed one
+
+    Args:
+        repo_url (str): Repository the manifest belongs to
+        manifest (dict): Output of build_manifest
+        scope (str): Endpoint the files were selected for, since endpoints pick different file sets
+
+    Returns:
+        dict: Change summary with the changed paths and how many files were unchanged
+    """
+    key = f"{scope}:{repo_url}"
+    previous = ANALYSIS_CACHE.get('manifest', key)
+    ANALYSIS_CACHE.set('manifest', key, manifest)
+
+    diff = diff_manifest(previous, manifest)
+    changed = len(diff['added']) + len(diff['modified'])
+    return {
+        'previous_manifest': previous is not None,
+        'changed_files': changed,
+        'removed_files': len(diff['removed']),
+        'unchanged_files': len(manifest) - changed
+    }
+
+
+def cached_per_file(namespace, content, compute, *key_parts, blob=None):
+    """Return compute(content) from the cache, keyed by the content's blob hash and any extra key parts"""
+    blob = blob or blob_hash(content)
+    key = ":".join([blob] + [str(part) for part in key_parts])
+    value = ANALYSIS_CACHE.get(namespace, key)
+    if value is None:
+        value = compute(content)
+        ANALYSIS_CACHE.set(namespace, key, value)
+    return value
+
+
+# How long a HEAD polled by the cache warmer is trusted; a few missed polls fall back to a full run
+CACHE_WARMER_HEAD_MAX_AGE = int(os.getenv('CACHE_WARMER_HEAD_MAX_AGE', str(int(os.getenv('CACHE_WARMER_INTERVAL', '300')) * 3)))
+
+
+def record_head(repo_url, sha):
+    """Remember the latest commit seen for a repository (written by the cache warmer)"""
+    ANALYSIS_CACHE.set('repo_head', repo_url, {'sha': sha, 'seen': time.time()})
+
+
+def known_head(repo_url, max_age=CACHE_WARMER_HEAD_MAX_AGE):
+    """Latest commit recorded for a repository within max_age seconds, or None"""
+    head = ANALYSIS_CACHE.get('repo_head', repo_url)
+    if head and time.time() - head['seen'] <= max_age:
+        return head['sha']
+    return None
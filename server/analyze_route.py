@@ -2,12 +2,12 @@ from flask import Blueprint, request, jsonify
 import os
 import json
 import re 
-import numpy as np
-import google.generativeai as genai
 from dotenv import load_dotenv
 from repo_utils import (
     download_repo, 
     extract_files, 
+    iter_extract_files,
+    estimate_processing_memory,
     extract_repo_features,
     generate_questions_with_gemini,
     classify_question_difficulty,
@@ -15,27 +15,84 @@ from repo_utils import (
     # _rule_based_company_classification,
     train_models
 )
-import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.multioutput import MultiOutputClassifier
-from sklearn.ensemble import RandomForestClassifier
+from compaction import build_files_context, compact_file_cached, get_compaction_level
+from review_utils import build_review_prompt, sharded_review
+from analysis_cache import (
+    ANALYSIS_CACHE,
+    CACHE_WARMER_HEAD_MAX_AGE,
+    build_manifest,
+    manifest_digest,
+    record_manifest,
+    cached_per_file,
+    known_head
+)
+from gemini_client import get_genai, get_gemini_model
+from model_store import load_model, loaded_models, preload_models
+from chat_sessions import create_session, get_session, end_session, chat_turn
+from admission import (
+    MEMORY_BUDGET,
+    AdmissionRejected,
+    admit_download,
+    resize_request,
+    release_request,
+    admission_rejected_response
+)
+from async_mode import run_cpu
 
 load_dotenv()
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
-
 analyze_bp = Blueprint('analyze', __name__)
+analyze_bp.teardown_app_request(release_request)
 
 DIFFICULTY_LEVELS = ["Easy", "Medium", "Hard"]
 COMPANY_TYPES = ["Startups", "FAANG", "FinTech", "Enterprise", "Healthcare", "Retail"]
 
-MODEL_DIR = os.path.join(os.path.dirname(__file__), 'models')
+MODEL_DIR = os.getenv('MODEL_DIR') or os.path.join(os.path.dirname(__file__), 'models')
 os.makedirs(MODEL_DIR, exist_ok=True)
 DIFFICULTY_MODEL_PATH = os.path.join(MODEL_DIR, 'difficulty_classifier.pkl') 
 COMPANY_MODEL_PATH = os.path.join(MODEL_DIR, 'company_classifier.pkl')
 VECTORIZER_PATH = os.path.join(MODEL_DIR, 'vectorizer.pkl')
 
+# Prompt compaction per endpoint: "none" (raw truncation), "blank" (blank out comments and
+# drop lockfiles, keeping line numbers), "strip" (drop comments, blank lines and lockfiles)
+# or "skeleton" (strip, then signatures only when over budget)
+ANALYZE_COMPACTION_LEVEL = get_compaction_level('ANALYZE_COMPACTION_LEVEL')
+REVIEW_COMPACTION_LEVEL = get_compaction_level('REVIEW_COMPACTION_LEVEL', default='blank')
+CHATBOT_COMPACTION_LEVEL = get_compaction_level('CHATBOT_COMPACTION_LEVEL')
+
+# Sharded review mode: large repositories are split into token-budgeted shards
+# that are reviewed in parallel and merged into a single response
+REVIEW_MODE = os.getenv('REVIEW_MODE', 'single')
+REVIEW_SHARD_MAX_FILES = int(os.getenv('REVIEW_SHARD_MAX_FILES', '200'))
+REVIEW_SHARD_TOKEN_BUDGET = int(os.getenv('REVIEW_SHARD_TOKEN_BUDGET', '6000'))
+REVIEW_SHARD_WORKERS = int(os.getenv('REVIEW_SHARD_WORKERS', '8'))
+REVIEW_SUMMARY_PASS = os.getenv('REVIEW_SUMMARY_PASS', 'false').lower() == 'true'
+
+def parse_bool(value):
+    """Interpret a JSON flag sent either as a boolean or as a string such as 'false'"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes')
+    return bool(value)
+
+def warmed_key(repo_url, *parts, head=None):
+    """Cache key pinned to the repository's polled HEAD, or None when no recent HEAD is known"""
+    head = head or known_head(repo_url, CACHE_WARMER_HEAD_MAX_AGE)
+    if head is None:
+        return None
+    return ":".join([f"{repo_url}@{head}", *parts])
+
+def review_response_key(repo_url, mode, summarize, head=None):
+    return warmed_key(repo_url, mode, REVIEW_COMPACTION_LEVEL, str(summarize) if mode == 'sharded' else '', head=head)
+
+def warmed_results_cached(repo_url, head):
+    """Whether the /analyze, default /review and chatbot context results for this commit are all cached"""
+    keys = [
+        ('analyze_response', warmed_key(repo_url, ANALYZE_COMPACTION_LEVEL, head=head)),
+        ('review_response', review_response_key(repo_url, REVIEW_MODE, REVIEW_SUMMARY_PASS, head=head)),
+        ('chat_context', warmed_key(repo_url, CHATBOT_COMPACTION_LEVEL, head=head))
+    ]
+    return all(ANALYSIS_CACHE.get(namespace, key) is not None for namespace, key in keys)
+
 @analyze_bp.route('/analyze', methods=['POST'])
 def analyze():
     data = request.json
@@ -44,36 +101,45 @@ def analyze():
     if not repo_url:
         return jsonify({'error': 'No repository URL provided'}), 400
     
+    # Watched repositories are precomputed by the cache warmer for their current HEAD
+    response_key = warmed_key(repo_url, ANALYZE_COMPACTION_LEVEL)
+    if response_key:
+        result = ANALYSIS_CACHE.get('analyze_response', response_key)
+        if result is not None:
+            return jsonify(result)
+    
+    if not admit_download():
+        return admission_rejected_response()
+    
     zip_content, error = download_repo(repo_url)
     if error:
         return jsonify({'error': error}), 400
     
+    if not resize_request(estimate_processing_memory(zip_content)):
+        return admission_rejected_response()
+    
     file_contents = extract_files(zip_content)
     if not file_contents:
         return jsonify({'error': 'No suitable files found in the repository'}), 400
     
     try:
-        repo_features, repo_content = extract_repo_features(file_contents)
-        
-        questions_data = generate_questions_with_gemini(file_contents)
+        manifest = run_cpu(build_manifest, file_contents)
+        changes = record_manifest(repo_url, manifest)
+        repo_features, repo_content = run_cpu(extract_repo_features, file_contents)
+        
+        # Questions only depend on the selected files, so an unchanged manifest reuses them
+        questions_key = f"{manifest_digest(manifest)}:{ANALYZE_COMPACTION_LEVEL}"
+        questions_data = ANALYSIS_CACHE.get('questions', questions_key)
+        changes['questions_cached'] = questions_data is not None
+        if questions_data is None:
+            questions_data = generate_questions_with_gemini(file_contents, ANALYZE_COMPACTION_LEVEL)
+            if not (isinstance(questions_data, dict) and "raw_response" in questions_data):
+                ANALYSIS_CACHE.set('questions', questions_key, questions_data)
         
         if isinstance(questions_data, dict) and "raw_response" in questions_data:
             return jsonify({'questions': questions_data["raw_response"], 'structured': False}), 200
         
-        classified_questions = []
-        for q in questions_data:
-            question_text = q['question']
-            question_context = q.get('context', '')
-            
-            difficulty = classify_question_difficulty(question_text, repo_content, question_context, DIFFICULTY_MODEL_PATH, VECTORIZER_PATH, DIFFICULTY_LEVELS)
-            companies = classify_question_companies(question_text, repo_features, question_context, COMPANY_MODEL_PATH, COMPANY_TYPES)
-            
-            classified_questions.append({
-                'question': question_text,
-                'context': question_context,
-                'difficulty': difficulty,
-                'companies': companies
-            })
+        classified_questions = run_cpu(classify_questions, questions_data, repo_features, repo_content)
         
         result = {
             'questions': classified_questions,
@@ -81,14 +147,43 @@ def analyze():
             'metadata': {
                 'difficulty_levels': DIFFICULTY_LEVELS,
                 'company_types': COMPANY_TYPES,
-                'repo_features': repo_features
+                'repo_features': repo_features,
+                'incremental': changes
             }
         }
         
+        if response_key:
+            ANALYSIS_CACHE.set('analyze_response', response_key, result)
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': f'Error analyzing repository: {str(e)}'}), 500
 
+def classify_questions(questions_data, repo_features, repo_content):
+    """Attach difficulty and company classifications to generated questions"""
+    classified_questions = []
+    for q in questions_data:
+        question_text = q['question']
+        question_context = q.get('context', '')
+        
+        difficulty = classify_question_difficulty(question_text, repo_content, question_context, DIFFICULTY_MODEL_PATH, VECTORIZER_PATH, DIFFICULTY_LEVELS)
+        companies = classify_question_companies(question_text, repo_features, question_context, COMPANY_MODEL_PATH, COMPANY_TYPES)
+        
+        classified_questions.append({
+            'question': question_text,
+            'context': question_context,
+            'difficulty': difficulty,
+            'companies': companies
+        })
+    return classified_questions
+
+def extract_and_compact(zip_content, max_files):
+    """Compact each file as soon as it is extracted; shard_files then hits the compaction cache"""
+    file_contents = {}
+    for filename, content in iter_extract_files(zip_content, max_files=max_files):
+        file_contents[filename] = content
+        run_cpu(compact_file_cached, filename, content, 3000, REVIEW_COMPACTION_LEVEL)
+    return file_contents
+
 @analyze_bp.route('/review', methods=['POST'])
 def review_code():
     """Analyze the repository code for potential improvements and code smells"""
@@ -98,97 +193,86 @@ def review_code():
     if not repo_url:
         return jsonify({'error': 'No repository URL provided'}), 400
     
+    mode = data.get('mode', REVIEW_MODE)
+    if mode not in ('single', 'sharded'):
+        return jsonify({'error': 'Invalid review mode. Must be "single" or "sharded"'}), 400
+    
+    summarize = parse_bool(data.get('summarize', REVIEW_SUMMARY_PASS))
+    response_key = review_response_key(repo_url, mode, summarize)
+    if response_key:
+        review_data = ANALYSIS_CACHE.get('review_response', response_key)
+        if review_data is not None:
+            return jsonify(review_data)
+    
+    if not admit_download():
+        return admission_rejected_response()
+    
     zip_content, error = download_repo(repo_url)
     if error:
         return jsonify({'error': error}), 400
     
-    file_contents = extract_files(zip_content)
+    max_files = REVIEW_SHARD_MAX_FILES if mode == 'sharded' else 20
+    if not resize_request(estimate_processing_memory(zip_content, max_files=max_files)):
+        return admission_rejected_response()
+    
+    if mode == 'sharded':
+        file_contents = extract_and_compact(zip_content, max_files)
+    else:
+        file_contents = extract_files(zip_content)
     if not file_contents:
         return jsonify({'error': 'No suitable files found in the repository'}), 400
     
+    manifest = run_cpu(build_manifest, file_contents)
+    changes = record_manifest(repo_url, manifest, scope=f'review-{mode}')
+    
+    if mode == 'sharded':
+        try:
+            review_data, shard_count, failed_shards, cached_shards = sharded_review(
+                file_contents,
+                shard_token_budget=REVIEW_SHARD_TOKEN_BUDGET,
+                max_workers=REVIEW_SHARD_WORKERS,
+                compaction_level=REVIEW_COMPACTION_LEVEL,
+                summarize=summarize
+            )
+            if not review_data:
+                return jsonify({'error': 'Could not parse JSON from Gemini response for any shard'}), 500
+            
+            review_data['review_metadata'] = {
+                'mode': 'sharded',
+                'files_reviewed': len(file_contents),
+                'shard_count': shard_count,
+                'failed_shards': failed_shards,
+                'cached_shards': cached_shards,
+                'incremental': changes
+            }
+            if response_key and not failed_shards:
+                ANALYSIS_CACHE.set('review_response', response_key, review_data)
+            return jsonify(review_data)
+        except Exception as e:
+            return jsonify({'error': f'Error reviewing repository: {str(e)}'}), 500
+    
     try:
+        review_key = f"{manifest_digest(manifest)}:{REVIEW_COMPACTION_LEVEL}"
+        review_data = ANALYSIS_CACHE.get('review', review_key)
+        if review_data is not None:
+            if response_key:
+                ANALYSIS_CACHE.set('review_response', response_key, review_data)
+            return jsonify(review_data)
+        
         # Prepare context for Gemini
-        context = "Repository Code Review Analysis:\n\n"
-        for filename, content in file_contents.items():
-            context += f"File: {filename}\n"
-            
-            # Limit content length to prevent excessive token usage
-            if len(content) > 3000:
-                content = content[:3000] + "\n... (content truncated)"
-            
-            context += f"Content:\n{content}\n\n"
+        # Compaction limits content length to prevent excessive token usage
+        context = run_cpu(
+            build_files_context,
+            "Repository Code Review Analysis:\n\n",
+            file_contents,
+            3000,
+            REVIEW_COMPACTION_LEVEL
+        )
         
         # Detailed prompt for comprehensive code review
-        prompt = f"""{context}
-
-Perform a comprehensive code review focusing on:
-
-1. Code Smells and Anti-Patterns:
-   - Identify code duplication
-   - Detect overly complex methods/functions
-   - Look for long methods that violate Single Responsibility Principle
-   - Find potential performance bottlenecks
-   - Identify unnecessary code or dead code
-
-2. Architectural Improvements:
-   - Suggest better design patterns
-   - Identify potential refactoring opportunities
-   - Recommend modularization strategies
-   - Suggest ways to improve code organization
-
-3. Best Practices and Standards:
-   - Check adherence to language-specific coding standards
-   - Look for potential security vulnerabilities
-   - Identify areas for improved error handling
-   - Recommend more efficient algorithms or data structures
-
-4. Potential Optimizations:
-   - Suggest performance improvements
-   - Identify memory-inefficient code
-   - Recommend more pythonic or idiomatic solutions
-
-Provide a structured JSON response with the following format:
-```json
-{{
-    "overall_code_quality": "Good/Average/Needs Improvement",
-    "code_smells": [
-        {{
-            "file": "filename.py",
-            "line_start": 10,
-            "line_end": 25,
-            "description": "Detailed explanation of the code smell",
-            "severity": "Low/Medium/High",
-            "suggestion": "Specific recommendation for improvement"
-        }}
-    ],
-    "architectural_suggestions": [
-        {{
-            "type": "Refactoring/Design Pattern/Modularization",
-            "description": "Detailed suggestion for improvement",
-            "potential_impact": "Brief explanation of expected benefits"
-        }}
-    ],
-    "performance_recommendations": [
-        {{
-            "file": "filename.py",
-            "description": "Performance improvement opportunity",
-            "suggested_optimization": "Specific code or approach to optimize"
-        }}
-    ],
-    "best_practices_feedback": [
-        {{
-            "category": "Error Handling/Security/Coding Standards",
-            "description": "Specific feedback and recommendations"
-        }}
-    ]
-}}
-```
-
-Ensure the response is comprehensive yet concise, focusing on actionable insights.
-Prioritize suggestions that can significantly improve code quality, maintainability, and performance.
-"""
+        prompt = build_review_prompt(context)
         
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = get_gemini_model()
         response = model.generate_content(prompt)
         
         try:
@@ -211,6 +295,9 @@ Prioritize suggestions that can significantly improve code quality, maintainabil
                     'error': f'Error parsing response: {str(e)}'
                 }), 200
         
+        ANALYSIS_CACHE.set('review', review_key, review_data)
+        if response_key:
+            ANALYSIS_CACHE.set('review_response', response_key, review_data)
         return jsonify(review_data)
     
     except Exception as e:
@@ -337,6 +424,12 @@ def train_company_classifier():
                 if company not in COMPANY_TYPES:
                     return jsonify({'error': f'Invalid company type: {company}. Must be one of {COMPANY_TYPES}'}), 400
         
+        import numpy as np
+        import joblib
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.multioutput import MultiOutputClassifier
+        from sklearn.ensemble import RandomForestClassifier
+        
         X_texts = [item['question'] + ' ' + item.get('context', '') for item in training_data]
         
         y_companies = np.zeros((len(training_data), len(COMPANY_TYPES)))
@@ -345,7 +438,7 @@ def train_company_classifier():
                 y_companies[i, COMPANY_TYPES.index(company)] = 1
         
         if os.path.exists(VECTORIZER_PATH):
-            vectorizer = joblib.load(VECTORIZER_PATH)
+            vectorizer = load_model(VECTORIZER_PATH)
             X_vectorized = vectorizer.transform(X_texts)
         else:
             vectorizer = TfidfVectorizer(max_features=5000)
@@ -369,24 +462,62 @@ def train_company_classifier():
     except Exception as e:
         return jsonify({'error': f'Error training company classifier: {str(e)}'}), 500
 
+@analyze_bp.route('/healthz', methods=['GET'])
+def healthz():
+    """Readiness check used as the warm-up request path"""
+    return jsonify({'status': 'ok', 'models_loaded': [os.path.basename(path) for path in loaded_models()]})
+
+@analyze_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-process resource metrics (each gunicorn worker reports its own)"""
+    return jsonify({'admission': MEMORY_BUDGET.metrics()})
+
+def warm_up():
+    """
+    Load the classifiers and run one prediction through each so the first real request doesn't pay for it
+
+    Called before gunicorn forks its workers, so the loaded models are shared copy-on-write.
+    """
+    get_genai()
+    preload_models([VECTORIZER_PATH, DIFFICULTY_MODEL_PATH, COMPANY_MODEL_PATH])
+
+    features, content = extract_repo_features({'warmup.py': 'def main():\n    return None\n'})
+    classify_question_difficulty("What does this function do?", content, "", DIFFICULTY_MODEL_PATH, VECTORIZER_PATH, DIFFICULTY_LEVELS)
+    classify_question_companies("What does this function do?", features, "", COMPANY_MODEL_PATH, COMPANY_TYPES)
+    ANALYSIS_CACHE.clear()
+
+# Bumped when FEATURE_PATTERNS change so per-blob counts cached on disk are recomputed
+FEATURE_PATTERNS_VERSION = 1
+FEATURE_PATTERNS = {
+    'python_count': ['.py', 'import ', 'def '],
+    'javascript_count': ['.js', 'function ', 'const '],
+    'web_count': ['.html', '.css', '<div'],
+    'api_count': ['/api', 'fetch(', 'http.'],
+    'db_count': ['SELECT', 'INSERT', 'database'],
+    'auth_count': ['auth', 'login', 'password'],
+    'ml_count': ['model', 'train', 'predict'],
+    'security_count': ['security', 'encrypt', 'hash']
+}
+
+def count_features(text):
+    """Count feature patterns in a piece of text (none of them span a newline, so counts add up per file)"""
+    return {feature: sum(text.count(pattern) for pattern in patterns)
+            for feature, patterns in FEATURE_PATTERNS.items()}
+
 def extract_repo_features(file_contents):
     """Extract features from repository content for ML models"""
-    all_content = ""
+    all_content = "".join(f"{filename}\n{content}\n\n" for filename, content in file_contents.items())
+    
+    features = {feature: 0 for feature in FEATURE_PATTERNS}
     for filename, content in file_contents.items():
-        all_content += f"{filename}\n{content}\n\n"
-    
-    features = {
-        'python_count': all_content.count('.py') + all_content.count('import ') + all_content.count('def '),
-        'javascript_count': all_content.count('.js') + all_content.count('function ') + all_content.count('const '),
-        'web_count': all_content.count('.html') + all_content.count('.css') + all_content.count('<div'),
-        'api_count': all_content.count('/api') + all_content.count('fetch(') + all_content.count('http.'),
-        'db_count': all_content.count('SELECT') + all_content.count('INSERT') + all_content.count('database'),
-        'auth_count': all_content.count('auth') + all_content.count('login') + all_content.count('password'),
-        'ml_count': all_content.count('model') + all_content.count('train') + all_content.count('predict'),
-        'security_count': all_content.count('security') + all_content.count('encrypt') + all_content.count('hash'),
-        'file_count': len(file_contents),
-        'total_lines': sum(content.count('\n') for content in file_contents.values())
-    }
+        # Content counts are cached by blob hash, so unchanged files are not rescanned on re-analysis
+        content_counts = cached_per_file('features', content, count_features, FEATURE_PATTERNS_VERSION)
+        filename_counts = count_features(filename)
+        for feature in features:
+            features[feature] += content_counts[feature] + filename_counts[feature]
+    
+    features['file_count'] = len(file_contents)
+    features['total_lines'] = sum(content.count('\n') for content in file_contents.values())
     
     return features, all_content
 
@@ -398,13 +529,13 @@ def classify_question_companies(question_text, repo_features, question_context="
     model_exists = model_path and os.path.exists(model_path)
     
     if model_exists:
-        company_model = joblib.load(model_path)
+        company_model = load_model(model_path)
         
         full_text = f"{question_text} {question_context}"
         
         vectorizer_path = os.path.join(os.path.dirname(model_path), 'vectorizer.pkl')
         if os.path.exists(vectorizer_path):
-            vectorizer = joblib.load(vectorizer_path)
+            vectorizer = load_model(vectorizer_path)
             text_features = vectorizer.transform([full_text])
             
             company_predictions = company_model.predict(text_features)[0]
@@ -495,6 +626,12 @@ def _rule_based_company_classification(question_text, repo_features, question_co
 def train_models(training_data, model_dir, difficulty_levels, company_types):
 
     """Train and save classification models using collected training data"""
+    import numpy as np
+    import joblib
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.multioutput import MultiOutputClassifier
+    from sklearn.ensemble import RandomForestClassifier
+    
     X_texts = [item['question'] + ' ' + item.get('context', '') for item in training_data]
     y_difficulty = [difficulty_levels.index(item['difficulty']) for item in training_data]
     
@@ -540,25 +677,34 @@ def extract_repo_context(repo_url):
     Returns:
         str: Extracted repository context
     """
-    if repo_url in REPO_CONTEXTS:
+    # Contexts of watched repositories are shared through the analysis cache per HEAD;
+    # everything else is kept per process until cleared
+    context_key = warmed_key(repo_url, CHATBOT_COMPACTION_LEVEL)
+    if context_key:
+        context = ANALYSIS_CACHE.get('chat_context', context_key)
+        if context is not None:
+            return context
+    elif repo_url in REPO_CONTEXTS:
         return REPO_CONTEXTS[repo_url]
     
+    if not admit_download():
+        raise AdmissionRejected(repo_url)
+    
     zip_content, error = download_repo(repo_url)
     if error:
         return f"Error downloading repository: {error}"
     
+    if not resize_request(estimate_processing_memory(zip_content, max_files=20)):
+        raise AdmissionRejected(repo_url)
+    
     file_contents = extract_files(zip_content, max_files=20)
     
-    context = "Repository Context:\n\n"
-    for filename, content in file_contents.items():
-        context += f"File: {filename}\n"
-        
-        if len(content) > 2000:
-            content = content[:2000] + "\n... (content truncated)"
-        
-        context += f"Content:\n{content}\n\n"
+    context = run_cpu(build_files_context, "Repository Context:\n\n", file_contents, 2000, CHATBOT_COMPACTION_LEVEL)
     
-    REPO_CONTEXTS[repo_url] = context
+    if context_key:
+        ANALYSIS_CACHE.set('chat_context', context_key, context)
+    else:
+        REPO_CONTEXTS[repo_url] = context
     
     return context
 
@@ -579,18 +725,29 @@ def chatbot():
     question = data.get('question')
     repo_url = data.get('repo_url', None)
     
+    # Optional multi-turn session: "session": true starts one, "session_id" continues it
+    session_id = data.get('session_id')
+    use_session = bool(session_id or data.get('session'))
+    
     if not question:
         return jsonify({'error': 'No question provided'}), 400
     
+    session = None
+    if session_id:
+        session = get_session(session_id)
+        if not session:
+            return jsonify({'error': 'Chat session not found or expired'}), 404
+        if repo_url and repo_url != session['repo_url']:
+            return jsonify({'error': 'Chat session belongs to a different repository'}), 400
+        repo_url = session['repo_url']
+    
     try:
         repo_context = ""
         if repo_url:
             repo_context = extract_repo_context(repo_url)
         
         if repo_url:
-            prompt = f"""{repo_context}
-
-Given the repository context above, please help me with the following:
+            message = f"""Given the repository context above, please help me with the following:
 
 {question}
 
@@ -600,8 +757,9 @@ Provide a detailed, actionable response that is:
 - Offering practical insights or solutions
 - Written in a clear, professional manner
 """
+            prompt = f"{repo_context}\n\n{message}"
         else:
-            prompt = f"""General Coding Assistance:
+            message = f"""General Coding Assistance:
 
 {question}
 
@@ -610,8 +768,21 @@ Please provide a comprehensive, technically accurate answer that includes:
 - Practical code examples if relevant
 - Best practices and considerations
 """
+            prompt = message
+        
+        if use_session:
+            if session is None:
+                session = create_session(repo_url)
+            response_text, context_cached = chat_turn(session, question, message, repo_context)
+            return jsonify({
+                'response': response_text,
+                'has_repo_context': bool(repo_url),
+                'session_id': session['session_id'],
+                'turns': len(session['history']) // 2,
+                'context_cached': context_cached
+            })
         
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = get_gemini_model()
         response = model.generate_content(prompt)
         
         return jsonify({
@@ -619,12 +790,28 @@ Please provide a comprehensive, technically accurate answer that includes:
             'has_repo_context': bool(repo_url)
         })
     
+    except AdmissionRejected:
+        return admission_rejected_response()
     except Exception as e:
         return jsonify({
             'error': f'Error processing chatbot request: {str(e)}',
             'details': str(e)
         }), 500
 
+@chatbot_bp.route('/clear_chat_session', methods=['POST'])
+def clear_chat_session():
+    """End a multi-turn chat session and discard its history"""
+    data = request.json
+    session_id = data.get('session_id')
+    
+    if not session_id:
+        return jsonify({'error': 'No session ID provided'}), 400
+    
+    if end_session(session_id):
+        return jsonify({'message': f'Chat session {session_id} cleared'})
+    
+    return jsonify({'message': 'No chat session found for the given ID'}), 404
+
 @chatbot_bp.route('/clear_repo_context', methods=['POST'])
 def clear_repo_context():
     """
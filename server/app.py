@@ -1,18 +1,46 @@
+import os
+from dotenv import load_dotenv
+
+# Project modules read their settings at import time, so .env must be loaded first
+load_dotenv()
+
 from flask import Flask
-from analyze_route import analyze_bp
-from analyze_route import chatbot_bp
 from flask_cors import CORS
+from analyze_route import analyze_bp, chatbot_bp, warm_up
+from profiling import init_profiling
+
+
+def create_app(preload=False):
+    """
+    Build the Flask application
+
+    With preload=True the classifiers and Gemini client are loaded and exercised up
+    front. The module-level app below is the one every entry point serves (flask run,
+    gunicorn's app:app, cache_warmer.py); PRELOAD_MODELS turns preloading on for it,
+    and gunicorn.conf.py does so with preload_app so workers inherit the models.
+    """
+    app = Flask(__name__)
+    CORS(app)
+
+    app.register_blueprint(analyze_bp)
+    app.register_blueprint(chatbot_bp)
+    init_profiling(app)
+
+    @app.route('/')
+    def index():
+        return "GitHub Repository Analyzer API - Use /analyze endpoint with POST request"
 
-app = Flask(__name__)
-CORS(app)
+    if preload:
+        warm_up()
 
+    return app
 
-app.register_blueprint(analyze_bp)
-app.register_blueprint(chatbot_bp)
 
-@app.route('/')
-def index():
-    return "GitHub Repository Analyzer API - Use /analyze endpoint with POST request"
+app = create_app(preload=os.getenv('PRELOAD_MODELS', 'false').lower() == 'true')
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Skip the reloader's parent process so only the serving process runs the warmer
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from cache_warmer import start_cache_warmer
+        start_cache_warmer(app)
+    app.run(debug=True)
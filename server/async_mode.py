@@ -0,0 +1,53 @@
+"""
+Support for the async serving mode (ASYNC_WORKERS=true in gunicorn.conf.py)
+
+In that mode the standard library is monkey-patched by gevent, so the routes' GitHub
+downloads, git subprocesses, Gemini REST calls and admission waits yield to other
+requests instead of holding a worker. CPU-bound stages would still stall every request
+in the process, so the routes hand them to run_cpu, which runs them on native threads.
+
+Both helpers must be called from the event loop, not from inside a run_cpu call: threads
+and executors created there would be greenlets nested in a second hub.
+"""
+import os
+
+ASYNC_CPU_THREADS = int(os.getenv('ASYNC_CPU_THREADS', str(os.cpu_count() or 4)))
+
+_cooperative = None
+_cpu_executor = None
+
+
+def is_cooperative():
+    """True when running under gevent's monkey-patching"""
+    global _cooperative
+    if _cooperative is None:
+        try:
+            from gevent import monkey
+            _cooperative = monkey.is_module_patched('socket')
+        except ImportError:
+            _cooperative = False
+    return _cooperative
+
+
+def cpu_executor():
+    """
+    Executor running on native threads in async mode, or None otherwise
+
+    Created on first use, so each forked worker gets its own threads. Waiting on its
+    futures from a greenlet yields to other requests.
+    """
+    global _cpu_executor
+    if not is_cooperative():
+        return None
+    if _cpu_executor is None:
+        from gevent.threadpool import ThreadPoolExecutor
+        _cpu_executor = ThreadPoolExecutor(max_workers=ASYNC_CPU_THREADS)
+    return _cpu_executor
+
+
+def run_cpu(func, *args, **kwargs):
+    """Run a CPU-bound call off the event loop in async mode; call it directly otherwise"""
+    executor = cpu_executor()
+    if executor is None:
+        return func(*args, **kwargs)
+    return executor.submit(func, *args, **kwargs).result()
@@ -0,0 +1,222 @@
+"""
+Background cache warmer for a watchlist of repositories
+
+Polls each watched repository's HEAD commit and, when it changes, precomputes the
+/analyze and /review responses and the chatbot context so interactive requests for
+watched repositories are served from the analysis cache.
+
+Runs inside one app worker (see gunicorn.conf.py) or standalone:
+
+    python cache_warmer.py            # poll forever
+    python cache_warmer.py --once     # one pass, e.g. from cron
+
+Set ANALYSIS_CACHE_DIR so the warmed results are visible to every worker.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Settings below and in the imported modules are read at import time
+load_dotenv()
+
+from analysis_cache import ANALYSIS_CACHE, record_head
+from repo_sources import get_head_sha
+from gemini_client import track_llm_usage
+
+# File with one repository URL per line (# comments allowed) or a JSON list of URLs
+CACHE_WARMER_WATCHLIST = os.getenv('CACHE_WARMER_WATCHLIST') or None
+CACHE_WARMER_INTERVAL = int(os.getenv('CACHE_WARMER_INTERVAL', '300'))
+CACHE_WARMER_CONCURRENCY = int(os.getenv('CACHE_WARMER_CONCURRENCY', '2'))
+# Upper bound on Gemini calls the warmer may spend per rolling hour
+CACHE_WARMER_MAX_LLM_CALLS_PER_HOUR = int(os.getenv('CACHE_WARMER_MAX_LLM_CALLS_PER_HOUR', '200'))
+CACHE_WARMER_LOCK_FILE = os.getenv('CACHE_WARMER_LOCK_FILE') or os.path.join(tempfile.gettempdir(), 'repo-analyzer-cache-warmer.lock')
+
+# Gemini calls reserved for a repository's first refresh (questions and a single-mode review);
+# later refreshes reserve what the previous one actually used, e.g. one call per review shard
+LLM_CALLS_PER_REFRESH = 2
+
+
+def load_watchlist(path):
+    with open(path) as f:
+        text = f.read()
+    if path.endswith('.json'):
+        return [url.strip() for url in json.loads(text) if url.strip()]
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith('#')]
+
+
+class LLMBudget:
+    """Rolling one-hour budget of LLM calls"""
+
+    def __init__(self, calls_per_hour):
+        self.calls_per_hour = calls_per_hour
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def try_spend(self, calls):
+        with self._lock:
+            cutoff = time.time() - 3600
+            while self._calls and self._calls[0] < cutoff:
+                self._calls.popleft()
+            if len(self._calls) + calls > self.calls_per_hour:
+                return False
+            self._calls.extend([time.time()] * calls)
+            return True
+
+    def settle(self, reserved, used):
+        """Replace a reservation made with try_spend by the number of calls actually made"""
+        with self._lock:
+            if used > reserved:
+                self._calls.extend([time.time()] * (used - reserved))
+            else:
+                for _ in range(min(reserved - used, len(self._calls))):
+                    self._calls.pop()
+
+
+class CacheWarmer:
+    """Polls watched repositories and refreshes their cached results when HEAD moves"""
+
+    def __init__(self, app, watchlist_path, interval=CACHE_WARMER_INTERVAL,
+                 concurrency=CACHE_WARMER_CONCURRENCY, llm_calls_per_hour=CACHE_WARMER_MAX_LLM_CALLS_PER_HOUR):
+        self.app = app
+        self.watchlist_path = watchlist_path
+        self.interval = interval
+        self.concurrency = concurrency
+        self.budget = LLMBudget(llm_calls_per_hour)
+        self.llm_calls_used = {}
+        self._stopped = threading.Event()
+
+    def refresh(self, repo_url, sha):
+        """Recompute everything an interactive request for this repository would need"""
+        from analyze_route import extract_repo_context
+
+        client = self.app.test_client()
+        for path in ('/analyze', '/review'):
+            response = client.post(path, json={'repo_url': repo_url})
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}")
+
+        with self.app.test_request_context():
+            extract_repo_context(repo_url)
+
+    def check(self, repo_url):
+        try:
+            sha = get_head_sha(repo_url)
+        except Exception as e:
+            print(f"Cache warmer: error polling {repo_url}: {str(e)}")
+            return 'error'
+
+        if sha is None:
+            return 'unpollable'
+
+        from analyze_route import warmed_results_cached
+
+        # Keep the head fresh for interactive lookups whether or not there is budget to refresh;
+        # requests that miss the cache then compute and store results under this commit
+        record_head(repo_url, sha)
+        if warmed_results_cached(repo_url, sha):
+            return 'cached'
+
+        reserved = self.llm_calls_used.get(repo_url, LLM_CALLS_PER_REFRESH)
+        if not self.budget.try_spend(reserved):
+            return 'over_budget'
+
+        with track_llm_usage() as usage:
+            try:
+                self.refresh(repo_url, sha)
+            except Exception as e:
+                print(f"Cache warmer: error refreshing {repo_url}: {str(e)}")
+                return 'error'
+            finally:
+                self.budget.settle(reserved, usage.calls)
+
+        if usage.calls:
+            self.llm_calls_used[repo_url] = usage.calls
+        return 'refreshed'
+
+    def run_once(self):
+        """Poll every watched repository once, returning a count per outcome"""
+        try:
+            watchlist = load_watchlist(self.watchlist_path)
+        except (OSError, ValueError) as e:
+            print(f"Cache warmer: error reading watchlist: {str(e)}")
+            return {}
+
+        outcomes = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for outcome in executor.map(self.check, watchlist):
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        return outcomes
+
+    def run_forever(self):
+        while not self._stopped.is_set():
+            started = time.time()
+            outcomes = self.run_once()
+            print(f"Cache warmer pass in {time.time() - started:.1f}s: {outcomes}")
+            self._stopped.wait(max(0, self.interval - (time.time() - started)))
+
+    def stop(self):
+        self._stopped.set()
+
+
+_lock_file = None
+
+
+def start_cache_warmer(app):
+    """
+    Start the warmer in a daemon thread if a watchlist is configured and no other process runs it
+
+    An exclusive lock file elects one worker; if it exits, the lock is released and the
+    next worker to start takes over.
+    """
+    global _lock_file
+    if not CACHE_WARMER_WATCHLIST or _lock_file is not None:
+        return None
+
+    try:
+        import fcntl
+    except ImportError:
+        print("Cache warmer: needs fcntl to elect a worker; run `python cache_warmer.py` separately on this platform")
+        return None
+
+    lock_file = open(CACHE_WARMER_LOCK_FILE, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    _lock_file = lock_file
+
+    if not ANALYSIS_CACHE.cache_dir:
+        print("Cache warmer: ANALYSIS_CACHE_DIR is not set, warmed results are only visible to this process")
+
+    warmer = CacheWarmer(app, CACHE_WARMER_WATCHLIST)
+    threading.Thread(target=warmer.run_forever, daemon=True, name='cache-warmer').start()
+    return warmer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--watchlist', default=CACHE_WARMER_WATCHLIST, help='Watchlist file')
+    parser.add_argument('--once', action='store_true', help='Run a single pass and exit')
+    args = parser.parse_args()
+
+    if not args.watchlist:
+        parser.error('No watchlist given (--watchlist or CACHE_WARMER_WATCHLIST)')
+
+    from app import app
+    warmer = CacheWarmer(app, args.watchlist)
+    if args.once:
+        print(warmer.run_once())
+    else:
+        warmer.run_forever()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
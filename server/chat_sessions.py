@@ -0,0 +1,297 @@
+import os
+import time
+import uuid
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from analysis_cache import ANALYSIS_CACHE, ResultCache
+from gemini_client import get_genai, get_gemini_model
+
+try:
+    import fcntl
+except ImportError:
+    # Without it sessions are only locked within this process
+    fcntl = None
+
+CHAT_SESSION_TTL = int(os.getenv('CHAT_SESSION_TTL', '3600'))
+CHAT_SESSION_MAX_SESSIONS = int(os.getenv('CHAT_SESSION_MAX_SESSIONS', '1000'))
+# Sessions are shared between workers through this directory (default: inside ANALYSIS_CACHE_DIR)
+CHAT_SESSION_DIR = os.getenv('CHAT_SESSION_DIR') or (
+    os.path.join(ANALYSIS_CACHE.cache_dir, 'chat_sessions') if ANALYSIS_CACHE.cache_dir else None)
+CHAT_SESSION_DIR_MAX_MB = int(os.getenv('CHAT_SESSION_DIR_MAX_MB', '64'))
+# Approximate tokens of verbatim history kept per session; older turns are summarised or dropped
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', '2000'))
+CHAT_SUMMARIZE_HISTORY = os.getenv('CHAT_SUMMARIZE_HISTORY', 'true').lower() == 'true'
+# Use the provider's context caching for repository context when the installed SDK supports it
+CHAT_CONTEXT_CACHING = os.getenv('CHAT_CONTEXT_CACHING', 'true').lower() == 'true'
+# Context caching needs an explicitly versioned model
+CHAT_CONTEXT_CACHE_MODEL = os.getenv('CHAT_CONTEXT_CACHE_MODEL') or 'gemini-2.0-flash-001'
+# Seconds before retrying context caching for a context the provider refused (e.g. below its minimum size)
+CHAT_CONTEXT_CACHE_RETRY = 600
+# Provider caches remembered per process; expired and refused ones are dropped first
+CHAT_CONTEXT_CACHE_MAX_ENTRIES = 256
+# Sessions and contexts hash onto this many locks (and session lock files)
+LOCK_STRIPES = 64
+
+CHARS_PER_TOKEN = 4
+CONTEXT_ACKNOWLEDGEMENT = "I have read the repository context and will use it to answer your questions."
+
+# Kept apart from the per-blob analysis cache so a large review can't evict active sessions.
+# Sessions change every turn, so with a directory they are always read from disk
+SESSION_STORE = ResultCache(
+    max_entries=CHAT_SESSION_MAX_SESSIONS,
+    cache_dir=CHAT_SESSION_DIR,
+    max_disk_bytes=CHAT_SESSION_DIR_MAX_MB * 1024 * 1024,
+    max_disk_age=CHAT_SESSION_TTL,
+    shared_namespaces=('chat_session',)
+)
+
+_session_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+_provider_caches = OrderedDict()
+_provider_cache_lock = threading.Lock()
+_provider_create_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def _stripe(key):
+    return int(hashlib.sha256(key.encode('utf-8')).hexdigest()[:8], 16) % LOCK_STRIPES
+
+
+@contextmanager
+def session_lock(session_id):
+    """
+    Serialise updates to one session between threads and, with CHAT_SESSION_DIR, between workers
+
+    The lock files live next to the session directory rather than in it, so pruning never
+    removes a file another worker holds.
+    """
+    stripe = _stripe(session_id)
+    with _session_locks[stripe]:
+        if not (CHAT_SESSION_DIR and fcntl):
+            yield
+            return
+        lock_dir = f"{CHAT_SESSION_DIR.rstrip(os.sep)}.locks"
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f"{stripe}.lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+
+def create_session(repo_url=None):
+    """Start a chat session, optionally bound to a repository"""
+    session = {
+        'session_id': uuid.uuid4().hex,
+        'repo_url': repo_url,
+        'history': [],
+        'summary': "",
+        'last_used': time.time()
+    }
+    save_session(session)
+    return session
+
+
+def get_session(session_id):
+    """Load a session, or None if it is unknown or has expired"""
+    session = SESSION_STORE.get('chat_session', session_id)
+    if not session:
+        return None
+    if time.time() - session['last_used'] > CHAT_SESSION_TTL:
+        SESSION_STORE.delete('chat_session', session_id)
+        return None
+    return session
+
+
+def save_session(session):
+    session['last_used'] = time.time()
+    SESSION_STORE.set('chat_session', session['session_id'], session)
+
+
+def end_session(session_id):
+    if not get_session(session_id):
+        return False
+    SESSION_STORE.delete('chat_session', session_id)
+    return True
+
+
+def _history_chars(history):
+    return sum(len(turn['text']) for turn in history)
+
+
+def _summarize_turns(summary, turns):
+    transcript = "\n".join(f"{turn['role']}: {turn['text']}" for turn in turns)
+    prompt = f"""Summarise this conversation about a code repository in at most 150 words.
+Keep decisions, file names and open questions; drop pleasantries.
+
+Earlier summary:
+{summary or "(none)"}
+
+New turns:
+{transcript}
+"""
+    return get_gemini_model().generate_content(prompt).text.strip()
+
+
+def record_turn(session, question, answer):
+    """Append a turn to the stored session, which a turn on another worker may have extended meanwhile"""
+    with session_lock(session['session_id']):
+        latest = get_session(session['session_id']) or session
+        latest['history'] = latest['history'] + [
+            {'role': 'user', 'text': question},
+            {'role': 'model', 'text': answer}
+        ]
+        save_session(latest)
+    session.update(latest)
+
+
+def _turns_to_fold(history):
+    budget_chars = CHAT_HISTORY_TOKEN_BUDGET * CHARS_PER_TOKEN
+    if _history_chars(history) <= budget_chars:
+        return []
+
+    # Trim to half the budget so summarisation runs every few turns rather than every turn
+    count = 0
+    while count < len(history) and _history_chars(history[count:]) > budget_chars // 2:
+        count += 2
+    return history[:count]
+
+
+def trim_history(session):
+    """
+    Fold the oldest turns into the running summary until history fits its token budget
+
+    The summary is written outside the session lock, and only applied if the stored
+    session still starts with the turns it summarises.
+    """
+    dropped = _turns_to_fold(session['history'])
+    if not dropped:
+        return
+
+    summary = session['summary']
+    if CHAT_SUMMARIZE_HISTORY:
+        try:
+            summary = _summarize_turns(summary, dropped)
+        except Exception as e:
+            print(f"Error summarising chat history: {str(e)}")
+
+    with session_lock(session['session_id']):
+        latest = get_session(session['session_id'])
+        if not latest or latest['history'][:len(dropped)] != dropped:
+            return
+        latest['history'] = latest['history'][len(dropped):]
+        latest['summary'] = summary
+        save_session(latest)
+    session.update(latest)
+
+
+def _context_cache_key(repo_context):
+    return hashlib.sha256(f"{CHAT_CONTEXT_CACHE_MODEL}:{repo_context}".encode('utf-8')).hexdigest()
+
+
+def _lookup_provider_cache(key):
+    with _provider_cache_lock:
+        cached = _provider_caches.get(key)
+        if cached and cached[0] > time.time() + 60:
+            _provider_caches.move_to_end(key)
+            return cached
+    return None
+
+
+def _store_provider_cache(key, expires, cached_content):
+    with _provider_cache_lock:
+        _provider_caches[key] = (expires, cached_content)
+        _provider_caches.move_to_end(key)
+        now = time.time()
+        for stale_key in [k for k, (k_expires, _) in _provider_caches.items() if k_expires <= now + 60]:
+            del _provider_caches[stale_key]
+        while len(_provider_caches) > CHAT_CONTEXT_CACHE_MAX_ENTRIES:
+            _provider_caches.popitem(last=False)
+    return expires, cached_content
+
+
+def get_cached_context_model(repo_context):
+    """
+    Return a model bound to provider-cached repository context, or None when caching is unavailable
+
+    Cached contents are shared by every session on the same context and recreated after expiry.
+    Refusals are remembered too, so an uncacheable context doesn't cost a failed call every turn.
+    Creation only holds a lock for its own context, so other contexts are served meanwhile.
+    """
+    if not CHAT_CONTEXT_CACHING:
+        return None
+    genai = get_genai()
+    if not hasattr(genai, 'caching'):
+        return None
+
+    key = _context_cache_key(repo_context)
+    cached = _lookup_provider_cache(key)
+    if cached is None:
+        with _provider_create_locks[_stripe(key)]:
+            # Another request may have created it while this one waited
+            cached = _lookup_provider_cache(key)
+            if cached is None:
+                try:
+                    cached_content = genai.caching.CachedContent.create(
+                        model=CHAT_CONTEXT_CACHE_MODEL,
+                        contents=[{'role': 'user', 'parts': [repo_context]}],
+                        ttl=datetime.timedelta(seconds=CHAT_SESSION_TTL)
+                    )
+                    cached = _store_provider_cache(key, time.time() + CHAT_SESSION_TTL, cached_content)
+                except Exception as e:
+                    # Contexts below the provider's minimum size, unsupported models, etc.
+                    print(f"Context caching unavailable, using local prefix: {str(e)}")
+                    cached = _store_provider_cache(key, time.time() + CHAT_CONTEXT_CACHE_RETRY, None)
+
+    if cached[1] is None:
+        return None
+    return genai.GenerativeModel.from_cached_content(cached_content=cached[1])
+
+
+def build_chat_contents(session, message, repo_context="", include_context=True):
+    """
+    Assemble multi-turn contents in a fixed order: repository context, summary, history, new message
+
+    The context always comes first and is byte-identical across turns, so when it is not
+    cached explicitly the provider can still reuse it as a common prefix.
+    """
+    contents = []
+    if repo_context and include_context:
+        contents.append({'role': 'user', 'parts': [repo_context]})
+        contents.append({'role': 'model', 'parts': [CONTEXT_ACKNOWLEDGEMENT]})
+    if session['summary']:
+        contents.append({'role': 'user', 'parts': [f"Summary of our conversation so far:\n{session['summary']}"]})
+        contents.append({'role': 'model', 'parts': ["Noted."]})
+    for turn in session['history']:
+        contents.append({'role': turn['role'], 'parts': [turn['text']]})
+    contents.append({'role': 'user', 'parts': [message]})
+    return contents
+
+
+def chat_turn(session, question, message, repo_context=""):
+    """
+    Answer one turn of a session and record it
+
+    The session is updated in place to the stored state, including turns recorded
+    concurrently by other requests.
+
+    Args:
+        session (dict): Session from create_session/get_session
+        question (str): The user's question as stored in history
+        message (str): The full instruction sent for this turn
+        repo_context (str): Repository context, empty for general sessions
+
+    Returns:
+        tuple: (response text, whether provider context caching was used)
+    """
+    model = get_cached_context_model(repo_context) if repo_context else None
+    context_cached = model is not None
+    if model is None:
+        model = get_gemini_model()
+
+    contents = build_chat_contents(session, message, repo_context, include_context=not context_cached)
+    response = model.generate_content(contents)
+
+    record_turn(session, question, response.text)
+    trim_history(session)
+
+    return response.text, context_cached
@@ -0,0 +1,395 @@
+import os
+import re
+import ast
+import io
+import json
+import tokenize
+from analysis_cache import cached_per_file
+
+COMPACTION_LEVELS = ["none", "blank", "strip", "skeleton"]
+# Bumped when compaction output changes so per-blob results cached on disk are recomputed
+COMPACTION_VERSION = 4
+
+LOCKFILE_NAMES = {
+    'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'npm-shrinkwrap.json', 'Pipfile.lock',
+    'poetry.lock', 'composer.lock', 'Cargo.lock', 'Gemfile.lock', 'go.sum', 'bun.lockb'
+}
+
+C_STYLE_EXTENSIONS = ('.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs', '.java', '.go', '.rs', '.c', '.cpp',
+                      '.h', '.cs', '.kt', '.swift')
+JS_EXTENSIONS = ('.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs', '.vue')
+# Languages where ' always opens a string; elsewhere it is a char literal, a Rust lifetime or a digit separator
+SINGLE_QUOTE_STRING_EXTENSIONS = JS_EXTENSIONS + ('.php',)
+# Only /* */ comments: // appears unquoted in url(http://...)
+CSS_EXTENSIONS = ('.css', '.scss', '.less')
+HASH_COMMENT_EXTENSIONS = ('.rb', '.sh', '.yml', '.yaml', '.toml', '.cfg', '.ini', '.txt')
+MARKUP_EXTENSIONS = ('.html', '.xml', '.md', '.vue')
+# Files mixing markup with code: C-style comments are only stripped inside these blocks,
+# since // appears unquoted in the markup (<a href="https://...">)
+EMBEDDED_CODE_BLOCKS = {
+    '.vue': re.compile(r'(<script\b[^>]*>)([\s\S]*?)(</script>|\Z)', re.IGNORECASE),
+    '.php': re.compile(r'(<\?(?:php\b|=)?)([\s\S]*?)(\?>|\Z)', re.IGNORECASE),
+}
+
+JS_SIGNATURE_PATTERNS = [
+    re.compile(r'^(export\s+)?(default\s+)?(async\s+)?function\b'),
+    re.compile(r'^(export\s+)?(default\s+)?(abstract\s+)?class\b'),
+    re.compile(r'^(export\s+)?(declare\s+)?(interface|type|enum)\b'),
+    re.compile(r'^(export\s+)?(const|let|var)\s+[\w$]+(\s*:\s*[^=]+)?\s*=\s*(async\s+)?(function\b|\([^)]*\)\s*(:\s*[^=]+)?=>|[\w$]+\s*=>)'),
+    re.compile(r'^(export\s+)?(const|let|var)\s+.*\brequire\('),
+    re.compile(r'^module\.exports\b'),
+    re.compile(r'^((static|async|get|set|public|private|protected|readonly)\s+)*[A-Za-z_$][\w$]*\s*\([^)]*\)\s*(:\s*[^{]+)?\{\s*$'),
+]
+JS_CONTROL_KEYWORDS = ('if', 'for', 'while', 'switch', 'catch', 'return', 'else', 'do', 'try', 'function')
+
+CHAR_LITERAL_PATTERN = re.compile(r"'(?:\\(?:u\{[0-9A-Fa-f]{1,6}\}|x[0-9A-Fa-f]{2}|[0-7]{1,3}|.)|[^\\'\n])'")
+# A / after one of these (or at the start) begins a regex literal rather than a division
+REGEX_PRECEDING_CHARS = set('(,=:[!&|?{};+-*%<>~^')
+REGEX_PRECEDING_KEYWORDS = ('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'void', 'yield', 'await',
+                            'delete', 'throw', 'new', 'instanceof')
+
+
+def get_compaction_level(env_var, default="skeleton"):
+    """Read a compaction level from the environment, falling back to the default for unknown values"""
+    level = os.getenv(env_var, default).strip().lower()
+    if level not in COMPACTION_LEVELS:
+        return default
+    return level
+
+
+def is_lockfile(filename):
+    """Check whether a file is a dependency lockfile that carries no useful signal for the LLM"""
+    return os.path.basename(filename) in LOCKFILE_NAMES
+
+
+def _drop_blank_lines(content):
+    return "\n".join(line.rstrip() for line in content.splitlines() if line.strip())
+
+
+def _strip_python_comments(content):
+    """Remove comments from Python source using the tokenizer so strings are left untouched"""
+    lines = content.splitlines()
+    try:
+        tokens = tokenize.generate_tokens(io.StringIO(content).readline)
+        for token in tokens:
+            if token.type == tokenize.COMMENT:
+                row, col = token.start
+                lines[row - 1] = lines[row - 1][:col]
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        pass
+    return "\n".join(lines)
+
+
+def _regex_allowed(result):
+    """Whether a / at this point of JS source starts a regex literal, judged by the preceding token"""
+    i = len(result) - 1
+    while i >= 0 and result[i].isspace():
+        i -= 1
+    if i < 0 or result[i] in REGEX_PRECEDING_CHARS:
+        return True
+    word = []
+    while i >= 0 and (result[i].isalnum() or result[i] in '_$'):
+        word.append(result[i])
+        i -= 1
+    return "".join(reversed(word)) in REGEX_PRECEDING_KEYWORDS
+
+
+def _regex_literal_end(content, start):
+    """Index just past the regex literal (with flags) starting at start, or None if it is not one"""
+    i = start + 1
+    in_class = False
+    while i < len(content):
+        char = content[i]
+        if char == '\n':
+            return None
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            i += 1
+            while i < len(content) and content[i].isalpha():
+                i += 1
+            return i
+        i += 1
+    return None
+
+
+def _strip_c_style_comments(content, line_comments=True, regex_literals=False, single_quote_strings=True):
+    """
+    Remove // and /* */ comments while skipping over string, char and template literals
+
+    Args:
+        content (str): Source text
+        line_comments (bool): Whether // starts a comment (not in CSS)
+        regex_literals (bool): Skip JS regex literals, which may contain quotes and //
+        single_quote_strings (bool): Whether ' opens a string; if not, only a complete
+            char literal such as 'a' or '\\n' is skipped and a lone ' (Rust lifetime) is plain text
+    """
+    result = []
+    i = 0
+    length = len(content)
+    quote = None
+    while i < length:
+        char = content[i]
+        if quote:
+            result.append(char)
+            if char == '\\' and i + 1 < length:
+                result.append(content[i + 1])
+                i += 2
+                continue
+            # Only template literals span lines; an unterminated string ends at the newline
+            if char == quote or (char == '\n' and quote != '`'):
+                quote = None
+            i += 1
+        elif char == "'" and not single_quote_strings:
+            match = CHAR_LITERAL_PATTERN.match(content, i)
+            end = match.end() if match else i + 1
+            result.append(content[i:end])
+            i = end
+        elif char in ('"', "'", '`'):
+            quote = char
+            result.append(char)
+            i += 1
+        elif line_comments and content.startswith('//', i):
+            end = content.find('\n', i)
+            i = length if end == -1 else end
+        elif content.startswith('/*', i):
+            end = content.find('*/', i + 2)
+            end = length if end == -1 else end + 2
+            # Keep the comment's line breaks so the lines after it stay where they were
+            result.append('\n' * content.count('\n', i, end))
+            i = end
+        elif char == '/' and regex_literals and _regex_allowed(result):
+            end = _regex_literal_end(content, i)
+            end = end or i + 1
+            result.append(content[i:end])
+            i = end
+        else:
+            result.append(char)
+            i += 1
+    return "".join(result)
+
+
+def _strip_hash_comments(content):
+    return "\n".join("" if line.lstrip().startswith('#') else line for line in content.splitlines())
+
+
+def _strip_markup_comments(content):
+    return re.sub(r'<!--[\s\S]*?-->', lambda match: '\n' * match.group(0).count('\n'), content)
+
+
+def _strip_embedded_code(content, block_pattern, **options):
+    return block_pattern.sub(
+        lambda match: match.group(1) + _strip_c_style_comments(match.group(2), **options) + match.group(3),
+        content
+    )
+
+
+def strip_noise(filename, content, keep_lines=False):
+    """
+    Remove comments, license headers and blank lines from a file based on its extension
+
+    With keep_lines=True comments are blanked out and empty lines kept, so every line
+    stays at its original line number (used for reviews, which cite line ranges).
+    """
+    if is_lockfile(filename):
+        return ""
+
+    lower = filename.lower()
+    if lower.endswith('.json') and not keep_lines:
+        try:
+            return json.dumps(json.loads(content), separators=(',', ':'))
+        except ValueError:
+            return _drop_blank_lines(content)
+
+    if lower.endswith('.py'):
+        content = _strip_python_comments(content)
+    elif lower.endswith(C_STYLE_EXTENSIONS):
+        content = _strip_c_style_comments(
+            content,
+            regex_literals=lower.endswith(JS_EXTENSIONS),
+            single_quote_strings=lower.endswith(SINGLE_QUOTE_STRING_EXTENSIONS)
+        )
+    elif lower.endswith(tuple(EMBEDDED_CODE_BLOCKS)):
+        content = _strip_embedded_code(
+            content,
+            EMBEDDED_CODE_BLOCKS[os.path.splitext(lower)[1]],
+            regex_literals=lower.endswith(JS_EXTENSIONS),
+            single_quote_strings=lower.endswith(SINGLE_QUOTE_STRING_EXTENSIONS)
+        )
+    elif lower.endswith(CSS_EXTENSIONS):
+        content = _strip_c_style_comments(content, line_comments=False)
+    elif lower.endswith(HASH_COMMENT_EXTENSIONS):
+        content = _strip_hash_comments(content)
+
+    if lower.endswith(MARKUP_EXTENSIONS):
+        content = _strip_markup_comments(content)
+
+    if keep_lines:
+        return "\n".join(line.rstrip() for line in content.splitlines())
+    return _drop_blank_lines(content)
+
+
+def _python_docstring(node):
+    docstring = ast.get_docstring(node)
+    if not docstring:
+        return None
+    first_paragraph = docstring.strip().split("\n\n")[0]
+    return '"""' + first_paragraph.replace('"""', "'''") + '"""'
+
+
+def _python_skeleton_lines(nodes, indent=""):
+    lines = []
+    for node in nodes:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            lines.append(indent + ast.unparse(node))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for decorator in node.decorator_list:
+                lines.append(f"{indent}@{ast.unparse(decorator)}")
+            prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+            returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+            lines.append(f"{indent}{prefix} {node.name}({ast.unparse(node.args)}){returns}:")
+            docstring = _python_docstring(node)
+            if docstring:
+                lines.append(f"{indent}    {docstring}")
+            lines.append(f"{indent}    ...")
+        elif isinstance(node, ast.ClassDef):
+            for decorator in node.decorator_list:
+                lines.append(f"{indent}@{ast.unparse(decorator)}")
+            bases = [ast.unparse(base) for base in node.bases] + [ast.unparse(kw) for kw in node.keywords]
+            signature = f"({', '.join(bases)})" if bases else ""
+            lines.append(f"{indent}class {node.name}{signature}:")
+            docstring = _python_docstring(node)
+            if docstring:
+                lines.append(f"{indent}    {docstring}")
+            body = _python_skeleton_lines(node.body, indent + "    ")
+            lines.extend(body or [f"{indent}    ..."])
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)) and not indent:
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = [ast.unparse(target) for target in targets]
+            if all(name.isupper() for name in names):
+                lines.append(f"{' = '.join(names)} = ...")
+    return lines
+
+
+def python_skeleton(content):
+    """Reduce Python source to imports, class and function signatures and docstrings"""
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return None
+
+    lines = []
+    docstring = _python_docstring(tree)
+    if docstring:
+        lines.append(docstring)
+    lines.extend(_python_skeleton_lines(tree.body))
+    return "\n".join(lines)
+
+
+def js_skeleton(content):
+    """Reduce JS/TS source (already comment-stripped) to imports, exports and signatures"""
+    lines = []
+    source_lines = content.splitlines()
+    i = 0
+    while i < len(source_lines):
+        line = source_lines[i]
+        stripped = line.strip()
+        i += 1
+
+        if stripped.startswith('import ') or stripped.startswith('export {') or stripped.startswith('export *'):
+            statement = [stripped]
+            while not re.search(r"(\bfrom\b\s*['\"].*['\"]|^import\s+['\"].*['\"])\s*;?$", " ".join(statement)) \
+                    and i < len(source_lines):
+                statement.append(source_lines[i].strip())
+                i += 1
+            lines.append(re.sub(r'\s+', ' ', " ".join(statement)))
+            continue
+
+        if stripped.split('(')[0].strip() in JS_CONTROL_KEYWORDS or stripped.startswith('} '):
+            continue
+
+        if any(pattern.match(stripped) for pattern in JS_SIGNATURE_PATTERNS):
+            indent = line[:len(line) - len(line.lstrip())]
+            if stripped.endswith('{'):
+                stripped = stripped[:-1].rstrip() + " { ... }"
+            lines.append(indent + stripped)
+
+    return "\n".join(lines)
+
+
+def truncate_at_line(content, max_chars):
+    """Cut content at the last line boundary under max_chars instead of mid-line"""
+    if len(content) <= max_chars:
+        return content
+    cut = content.rfind('\n', 0, max_chars)
+    if cut <= 0:
+        cut = max_chars
+    return content[:cut] + "\n... (content truncated)"
+
+
+def compact_file(filename, content, max_chars, level="skeleton"):
+    """
+    Compact a single file for inclusion in an LLM prompt
+
+    Args:
+        filename (str): Path of the file inside the repository
+        content (str): Raw file text
+        max_chars (int): Character budget for this file
+        level (str): One of "none", "blank", "strip" or "skeleton"
+
+    Returns:
+        str: Compacted content, empty if the file should be left out entirely
+    """
+    if level == "none":
+        if len(content) > max_chars:
+            return content[:max_chars] + "\n... (content truncated)"
+        return content
+
+    if level == "blank":
+        return truncate_at_line(strip_noise(filename, content, keep_lines=True), max_chars)
+
+    content = strip_noise(filename, content)
+    if len(content) <= max_chars or level == "strip":
+        return truncate_at_line(content, max_chars)
+
+    lower = filename.lower()
+    skeleton = None
+    if lower.endswith('.py'):
+        skeleton = python_skeleton(content)
+    elif lower.endswith(JS_EXTENSIONS):
+        skeleton = js_skeleton(content)
+
+    if skeleton:
+        return truncate_at_line("(skeleton: signatures only)\n" + skeleton, max_chars)
+
+    return truncate_at_line(content, max_chars)
+
+
+def compact_file_cached(filename, content, max_chars, level="skeleton"):
+    """compact_file, reusing earlier output for identical file content across commits"""
+    return cached_per_file(
+        'compaction',
+        content,
+        lambda text: compact_file(filename, text, max_chars, level),
+        os.path.basename(filename),
+        max_chars,
+        level,
+        COMPACTION_VERSION
+    )
+
+
+def build_files_context(header, file_contents, max_chars, level="skeleton"):
+    """Build the File:/Content: prompt section shared by the LLM endpoints"""
+    context = header
+    for filename, content in file_contents.items():
+        content = compact_file_cached(filename, content, max_chars, level)
+        if not content:
+            continue
+        context += f"File: {filename}\n"
+        context += f"Content:\n{content}\n\n"
+    return context
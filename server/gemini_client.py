@@ -0,0 +1,81 @@
+import os
+import threading
+import contextvars
+from contextlib import contextmanager
+
+GEMINI_MODEL_NAME = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+# Alternative API endpoint (e.g. the load-test stub); served over the REST transport
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT') or None
+# "grpc" or "rest"; async workers use REST, whose sockets gevent can make non-blocking
+GEMINI_TRANSPORT = os.getenv('GEMINI_TRANSPORT') or ('rest' if GEMINI_API_ENDPOINT else None)
+
+_genai = None
+_genai_lock = threading.Lock()
+_llm_usage = contextvars.ContextVar('llm_usage', default=None)
+
+
+class LLMUsage:
+    """Count of Gemini calls made while a track_llm_usage block is active"""
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def add(self, calls=1):
+        with self._lock:
+            self.calls += calls
+
+
+@contextmanager
+def track_llm_usage():
+    """
+    Count the generate_content calls made in this context
+
+    Worker threads only see the counter if they run in a copy of the caller's
+    context (see review_utils.sharded_review).
+    """
+    usage = LLMUsage()
+    token = _llm_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _llm_usage.reset(token)
+
+
+class TrackedModel:
+    """GenerativeModel wrapper that reports each generate_content call to the active LLMUsage"""
+
+    def __init__(self, model):
+        self._model = model
+
+    def generate_content(self, *args, **kwargs):
+        usage = _llm_usage.get()
+        if usage is not None:
+            usage.add()
+        return self._model.generate_content(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+def get_genai():
+    """Import and configure google.generativeai on first use, keeping it off the import path"""
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+                options = {}
+                if GEMINI_TRANSPORT:
+                    options['transport'] = GEMINI_TRANSPORT
+                if GEMINI_API_ENDPOINT:
+                    options['client_options'] = {'api_endpoint': GEMINI_API_ENDPOINT}
+                genai.configure(api_key=api_key, **options)
+                _genai = genai
+    return _genai
+
+
+def get_gemini_model(model_name=None):
+    """Return a Gemini model handle, defaulting to GEMINI_MODEL"""
+    return TrackedModel(get_genai().GenerativeModel(model_name or GEMINI_MODEL_NAME))
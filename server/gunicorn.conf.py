@@ -0,0 +1,61 @@
+# Production launch: gunicorn -c gunicorn.conf.py
+#
+# The app is built once in the master with models loaded and warmed up, then
+# forked, so every worker shares the model pages copy-on-write instead of
+# loading its own copy on the first request.
+#
+# ASYNC_WORKERS=true switches to gevent workers: blocking I/O in the routes
+# yields instead of holding the worker, so each process serves up to
+# ASYNC_WORKER_CONNECTIONS requests at once (CPU stages go to a thread pool,
+# see async_mode.py).
+import os
+from dotenv import load_dotenv
+
+# Load server/.env before this file or the app reads any setting; gunicorn doesn't
+load_dotenv()
+
+ASYNC_WORKERS = os.getenv('ASYNC_WORKERS', 'false').lower() == 'true'
+if ASYNC_WORKERS:
+    # Patch before the preloaded app imports socket/ssl, not after the fork
+    from gevent import monkey
+    monkey.patch_all()
+    os.environ.setdefault('GEMINI_TRANSPORT', 'rest')
+
+import gc
+import multiprocessing
+
+# The module-level app in app.py is the only one built; it warms up the models when
+# PRELOAD_MODELS is set, which is the default here
+os.environ.setdefault('PRELOAD_MODELS', 'true')
+wsgi_app = "app:app"
+preload_app = True
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+accesslog = '-'
+
+if ASYNC_WORKERS:
+    worker_class = 'gevent'
+    worker_connections = int(os.getenv('ASYNC_WORKER_CONNECTIONS', '500'))
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far into the permanent generation so the
+    # garbage collector doesn't touch (and copy) the shared pages in workers
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Warm-up request through the full WSGI stack in each worker
+    client = worker.wsgi.test_client()
+    response = client.get('/healthz')
+    worker.log.info("Worker %s warm-up: /healthz %s", worker.pid, response.status_code)
+
+    # The first worker to get the lock polls the watchlist (no-op without CACHE_WARMER_WATCHLIST)
+    from cache_warmer import start_cache_warmer
+    if start_cache_warmer(worker.wsgi):
+        worker.log.info("Worker %s runs the cache warmer", worker.pid)
@@ -0,0 +1,437 @@
+"""
+Load-test harness for the analyzer API
+
+Starts local stub servers for the GitHub zipball API and the Gemini REST API,
+optionally launches the app against them, drives /analyze, /review, /chatbot and
+/feedback with a configurable concurrency and request mix, and reports throughput,
+latency percentiles, errors and worker RSS per endpoint.
+
+    python loadtest.py --start-app --concurrency 32 --duration 60 \
+        --mix analyze=3,review=1,chatbot=4,feedback=2 --gemini-latency 1.5
+
+Against an already running server, point it at the stubs printed on startup
+(GITHUB_API_URL and GEMINI_API_ENDPOINT) and pass --target.
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+# The launched app inherits this environment; explicit stub settings still take precedence
+load_dotenv()
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STUB_QUESTIONS = [
+    {"question": "What is the main purpose of this application?", "context": "Establishes the core domain"},
+    {"question": "How does the service layer handle errors from the database?", "context": "Error handling"},
+    {"question": "How would you scale the request handling for many concurrent users?", "context": "Performance"},
+    {"question": "Why is the configuration loaded at import time?", "context": "Architecture"},
+    {"question": "How are API credentials protected?", "context": "Security"}
+]
+
+STUB_REVIEW = {
+    "overall_code_quality": "Average",
+    "code_smells": [{"file": "src/module_0.py", "line_start": 1, "line_end": 20,
+                     "description": "Long function mixing I/O and parsing", "severity": "Medium",
+                     "suggestion": "Split parsing into a pure helper"}],
+    "architectural_suggestions": [{"type": "Modularization", "description": "Extract a service layer",
+                                   "potential_impact": "Easier testing"}],
+    "performance_recommendations": [{"file": "src/module_1.js", "description": "Repeated string concatenation",
+                                     "suggested_optimization": "Collect parts and join once"}],
+    "best_practices_feedback": [{"category": "Error Handling", "description": "Avoid bare except clauses"}]
+}
+
+
+def synthetic_zip(repo, files, file_size):
+    """Build a zipball-shaped archive of generated Python and JS files for a repo name"""
+    rng = random.Random(repo)
+    buffer = io.BytesIO()
+    prefix = f"synthetic-{repo}-{rng.getrandbits(28):07x}/"
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr(prefix + "README.md", f"# {repo}\n\nSynthetic repository for load testing.\n")
+        for i in range(files):
+            if i % 2 == 0:
+                name = f"src/module_{i}.py"
+                unit = (f"def handler_{i}_{{n}}(request):\n    \"\"\"Handle request {{n}}\"\"\"\n"
+                        f"    value = request.get('v{{n}}', {rng.randint(0, 999)})\n    return value * 2\n\n")
+            else:
+                name = f"src/module_{i}.js"
+                unit = (f"export function handler{i}_{{n}}(req) {{{{\n  const value = req.v{{n}} ?? {rng.randint(0, 999)}\n"
+                        f"  return fetch('/api/items/' + value)\n}}}}\n\n")
+            parts, size, n = [], 0, 0
+            while size < file_size:
+                part = unit.format(n=n)
+                parts.append(part)
+                size += len(part)
+                n += 1
+            zip_file.writestr(prefix + name, "".join(parts)[:file_size])
+
+    return buffer.getvalue()
+
+
+class GitHubStubHandler(BaseHTTPRequestHandler):
+    """Serves GET /repos/<owner>/<repo>/zipball/<ref> with synthetic archives"""
+
+    def do_GET(self):
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if len(parts) != 5 or parts[0] != 'repos' or parts[3] != 'zipball':
+            self.send_error(404)
+            return
+
+        config = self.server.config
+        repo = parts[2]
+        with self.server.lock:
+            if repo not in self.server.archives:
+                self.server.archives[repo] = synthetic_zip(repo, config.zip_files, config.zip_file_size)
+            body = self.server.archives[repo]
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GeminiStubHandler(BaseHTTPRequestHandler):
+    """Answers generateContent / streamGenerateContent with canned JSON after a configurable delay"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request_body = self.rfile.read(length).decode('utf-8', 'ignore')
+        config = self.server.config
+
+        if 'code review' in request_body:
+            text = "```json\n" + json.dumps(STUB_REVIEW) + "\n```"
+        elif 'generate 5-10 questions' in request_body:
+            text = "```json\n" + json.dumps(STUB_QUESTIONS) + "\n```"
+        else:
+            text = "The repository is organised into handler modules. " * 20
+
+        delay = max(0.0, random.gauss(config.gemini_latency, config.gemini_jitter))
+        path = self.path.split('?')[0]
+
+        if path.endswith(':streamGenerateContent'):
+            chunks = [text[i:i + 200] for i in range(0, len(text), 200)] or [""]
+            pieces = [("[" if i == 0 else ",") + json.dumps(self._candidate(chunk)) for i, chunk in enumerate(chunks)]
+            self._send_chunked(pieces + ["]"], delay)
+            return
+
+        if config.gemini_stream:
+            # Non-streaming calls still get a single response object, just trickled out over the delay
+            body = json.dumps(self._candidate(text))
+            self._send_chunked([body[i:i + 200] for i in range(0, len(body), 200)], delay)
+            return
+
+        time.sleep(delay)
+        body = json.dumps(self._candidate(text)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _candidate(self, text):
+        return {
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                            "finishReason": "STOP", "index": 0, "safetyRatings": []}],
+            "promptFeedback": {"safetyRatings": []}
+        }
+
+    def _send_chunked(self, pieces, delay):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for piece in pieces:
+            time.sleep(delay / len(pieces))
+            self._write_chunk(piece)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(handler, config):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    server.config = config
+    server.lock = threading.Lock()
+    server.archives = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def process_tree(root_pid):
+    """PIDs of a process and all its descendants, read from /proc"""
+    children = defaultdict(list)
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            children[ppid].append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler(threading.Thread):
+    """Tracks peak RSS of the app's master and worker processes while the test runs"""
+
+    def __init__(self, root_pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.root_pid = root_pid
+        self.interval = interval
+        self.peak = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            for pid in process_tree(self.root_pid):
+                self.peak[pid] = max(self.peak.get(pid, 0), rss_kb(pid))
+            self.stopped.wait(self.interval)
+
+    def summary(self):
+        workers = [kb for pid, kb in self.peak.items() if pid != self.root_pid]
+        return {
+            'master_rss_mb': round(self.peak.get(self.root_pid, 0) / 1024, 1),
+            'workers': len(workers),
+            'max_worker_rss_mb': round(max(workers, default=0) / 1024, 1),
+            'total_rss_mb': round(sum(self.peak.values()) / 1024, 1)
+        }
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - {'analyze', 'review', 'chatbot', 'feedback'}
+    if unknown:
+        raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+def request_for(endpoint, rng, repos):
+    repo_url = f"https://github.com/synthetic/repo-{rng.randrange(repos)}"
+    if endpoint in ('analyze', 'review'):
+        return f"/{endpoint}", {'repo_url': repo_url}
+    if endpoint == 'chatbot':
+        return "/chatbot", {'repo_url': repo_url, 'question': 'How are requests handled in this repository?'}
+    return "/feedback", {
+        'question': 'How does the handler validate input?',
+        'context': 'Input validation',
+        'correct_difficulty': rng.choice(['Easy', 'Medium', 'Hard']),
+        'correct_companies': [rng.choice(['Startups', 'FAANG', 'Enterprise'])]
+    }
+
+
+def send(target, path, payload, timeout):
+    request = urllib.request.Request(
+        target + path,
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception:
+        return 0
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_load(args, target):
+    weights = parse_mix(args.mix)
+    endpoints, endpoint_weights = list(weights), list(weights.values())
+    results = defaultdict(list)
+    results_lock = threading.Lock()
+    deadline = time.time() + args.duration
+    issued = [0]
+
+    def worker(seed):
+        rng = random.Random(seed)
+        while time.time() < deadline:
+            with results_lock:
+                if args.requests and issued[0] >= args.requests:
+                    return
+                issued[0] += 1
+            endpoint = rng.choices(endpoints, endpoint_weights)[0]
+            path, payload = request_for(endpoint, rng, args.repos)
+            start = time.perf_counter()
+            status = send(target, path, payload, args.timeout)
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                results[endpoint].append((elapsed, status))
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for i in range(args.concurrency):
+            executor.submit(worker, args.seed + i)
+    wall = time.time() - started
+
+    report = {'wall_seconds': round(wall, 2), 'concurrency': args.concurrency, 'endpoints': {}}
+    for endpoint, samples in sorted(results.items()):
+        latencies = [elapsed for elapsed, _ in samples]
+        errors = [status for _, status in samples if not 200 <= status < 300]
+        report['endpoints'][endpoint] = {
+            'requests': len(samples),
+            'throughput_rps': round(len(samples) / wall, 2) if wall else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'errors': len(errors),
+            'error_statuses': sorted(set(errors))
+        }
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['wall_seconds']}s at concurrency {report['concurrency']}\n")
+    print(f"{'endpoint':<10} {'reqs':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for endpoint, stats in report['endpoints'].items():
+        print(f"{endpoint:<10} {stats['requests']:>7} {stats['throughput_rps']:>8} {stats['p50_ms']:>9} "
+              f"{stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['errors']:>7}")
+    if 'rss' in report:
+        rss = report['rss']
+        print(f"\nRSS: master {rss['master_rss_mb']} MB, {rss['workers']} workers, "
+              f"max worker {rss['max_worker_rss_mb']} MB, total {rss['total_rss_mb']} MB")
+
+
+def wait_until_ready(target, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"App exited during startup with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(target + '/healthz', timeout=2) as response:
+                if response.status == 200:
+                    return
+        except Exception:
+            time.sleep(0.5)
+    raise SystemExit("App did not become ready in time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', default='http://127.0.0.1:5000', help='Base URL of a running app')
+    parser.add_argument('--start-app', action='store_true', help='Launch the app against the stubs')
+    parser.add_argument('--app-cmd', default='gunicorn -c gunicorn.conf.py --bind 127.0.0.1:{port}',
+                        help='Command used with --start-app; {port} is substituted')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--requests', type=int, default=0, help='Stop after this many requests (0 = no limit)')
+    parser.add_argument('--mix', default='analyze=3,review=1,chatbot=4,feedback=2',
+                        help='Relative weights per endpoint')
+    parser.add_argument('--repos', type=int, default=50, help='Distinct synthetic repositories')
+    parser.add_argument('--zip-files', type=int, default=40, help='Files per synthetic repository')
+    parser.add_argument('--zip-file-size', type=int, default=4000, help='Bytes per synthetic file')
+    parser.add_argument('--gemini-latency', type=float, default=1.0, help='Mean stub LLM latency in seconds')
+    parser.add_argument('--gemini-jitter', type=float, default=0.2)
+    parser.add_argument('--gemini-stream', action='store_true', help='Send responses chunked over the latency, like a slowly streaming upstream')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    github_stub, github_url = start_stub(GitHubStubHandler, args)
+    gemini_stub, gemini_url = start_stub(GeminiStubHandler, args)
+    print(f"GITHUB_API_URL={github_url}")
+    print(f"GEMINI_API_ENDPOINT={gemini_url}")
+
+    process, sampler, model_dir = None, None, None
+    target = args.target.rstrip('/')
+    try:
+        if args.start_app:
+            # Feedback retrains the models, so run against a throwaway copy of them
+            model_dir = tempfile.mkdtemp(prefix='loadtest-models-')
+            shutil.copytree(os.path.join(SERVER_DIR, 'models'), model_dir, dirs_exist_ok=True)
+            env = dict(os.environ, GITHUB_API_URL=github_url, GEMINI_API_ENDPOINT=gemini_url,
+                       GEMINI_API_KEY='loadtest', MODEL_DIR=model_dir, GIT_MIRROR_ROOT='')
+            process = subprocess.Popen(args.app_cmd.format(port=args.port).split(), cwd=SERVER_DIR, env=env)
+            target = f"http://127.0.0.1:{args.port}"
+            wait_until_ready(target, process)
+            if os.path.isdir('/proc'):
+                sampler = RssSampler(process.pid)
+                sampler.start()
+
+        report = run_load(args, target)
+        if sampler:
+            sampler.stopped.set()
+            sampler.join()
+            report['rss'] = sampler.summary()
+
+        print_report(report)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if process:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if model_dir:
+            shutil.rmtree(model_dir, ignore_errors=True)
+        github_stub.shutdown()
+        gemini_stub.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import os
+import threading
+
+_MODELS = {}
+_models_lock = threading.Lock()
+
+
+def load_model(path):
+    """
+    Load a joblib-pickled model, reusing the in-process copy until the file changes
+
+    Models loaded before gunicorn forks its workers are shared copy-on-write, and a
+    retrain in any worker is picked up by the others through the file's mtime.
+    """
+    mtime = os.path.getmtime(path)
+    cached = _MODELS.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    import joblib
+    with _models_lock:
+        cached = _MODELS.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        model = joblib.load(path)
+        _MODELS[path] = (mtime, model)
+    return model
+
+
+def preload_models(paths):
+    """Load every existing model file up front, returning the paths that were loaded"""
+    loaded = []
+    for path in paths:
+        if path and os.path.exists(path):
+            load_model(path)
+            loaded.append(path)
+    return loaded
+
+
+def loaded_models():
+    return sorted(_MODELS)
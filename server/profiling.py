@@ -0,0 +1,199 @@
+import os
+import sys
+import hmac
+import time
+import uuid
+import random
+import tempfile
+import importlib
+import threading
+from collections import Counter
+from flask import Blueprint, request, jsonify, g, send_from_directory, abort
+from async_mode import is_cooperative
+
+# Token required for X-Profile / ?profile=1 and the admin endpoints; unset disables both
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN') or None
+# Fraction of requests profiled without being asked (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000
+PROFILE_DIR = os.getenv('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'repo-analyzer-profiles')
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '50'))
+
+profiling_bp = Blueprint('profiling', __name__)
+_prune_lock = threading.Lock()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _native(module, name):
+    """Standard library attribute as it was before gevent's monkey-patching, if any"""
+    if is_cooperative():
+        from gevent import monkey
+        return monkey.get_original(module, name)
+    return getattr(importlib.import_module(module), name)
+
+
+class StackSampler:
+    """
+    Samples one thread's (or greenlet's) stack at a fixed interval and counts collapsed stacks
+
+    The sampler always runs on a native thread so it keeps sampling while the event loop
+    is busy in async mode. A greenlet's stack is read from gr_frame while it is suspended,
+    and from its native thread while it runs; work handed to run_cpu shows up as the wait
+    for its result.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL, greenlet=None):
+        self.thread_id = thread_id
+        self.greenlet = greenlet
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = False
+        self._finished = _native('_thread', 'allocate_lock')()
+
+    def start(self):
+        self._finished.acquire()
+        _native('_thread', 'start_new_thread')(self.run, ())
+
+    def _current_frame(self):
+        if self.greenlet is None:
+            return sys._current_frames().get(self.thread_id)
+        if self.greenlet.dead:
+            return None
+        # gr_frame is only set while the greenlet is switched out
+        return self.greenlet.gr_frame or sys._current_frames().get(self.thread_id)
+
+    def run(self):
+        sleep = _native('time', 'sleep')
+        try:
+            while True:
+                sleep(self.interval)
+                if self._stopped:
+                    break
+                frame = self._current_frame()
+                if frame is None:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                # Collapsed stacks are root first
+                self.stacks[";".join(reversed(labels))] += 1
+                self.samples += 1
+        finally:
+            self._finished.release()
+
+    def stop(self):
+        self._stopped = True
+        self._finished.acquire()
+        self._finished.release()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _valid_token(token):
+    return bool(PROFILE_ADMIN_TOKEN and token and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN))
+
+
+def _profile_requested():
+    asked = request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+    if asked and _valid_token(request.headers.get('X-Admin-Token')):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _prune_profiles():
+    with _prune_lock:
+        names = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith('.collapsed'))
+        for name in names[:max(0, len(names) - PROFILE_MAX_FILES)]:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name))
+            except OSError:
+                pass
+
+
+def start_profile():
+    if request.endpoint and request.endpoint.startswith('profiling.'):
+        return
+    if not _profile_requested():
+        return
+    greenlet = None
+    if is_cooperative():
+        from greenlet import getcurrent
+        greenlet = getcurrent()
+    sampler = StackSampler(_native('_thread', 'get_ident')(), greenlet=greenlet)
+    sampler.start()
+    g.profiler = sampler
+    g.profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{(request.endpoint or 'unknown').replace('.', '_')}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def attach_profile_id(response):
+    if g.get('profile_id'):
+        response.headers['X-Profile-Id'] = g.profile_id
+    return response
+
+
+def finish_profile(exception=None):
+    """Stop the sampler and write the collapsed stacks, keeping at most PROFILE_MAX_FILES profiles"""
+    sampler = g.pop('profiler', None)
+    if sampler is None:
+        return
+    sampler.stop()
+    if not sampler.samples:
+        return
+
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, f"{g.profile_id}.collapsed"), 'w') as f:
+            f.write(sampler.collapsed())
+        _prune_profiles()
+    except OSError as e:
+        print(f"Error writing profile: {str(e)}")
+
+
+def init_profiling(app):
+    """Register the per-request profiling hooks and admin endpoints on the app"""
+    app.before_request(start_profile)
+    app.after_request(attach_profile_id)
+    app.teardown_request(finish_profile)
+    app.register_blueprint(profiling_bp)
+
+
+@profiling_bp.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """List stored profiles, newest first"""
+    if not _valid_token(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'Invalid admin token'}), 403
+
+    profiles = []
+    if os.path.isdir(PROFILE_DIR):
+        for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+            if not name.endswith('.collapsed'):
+                continue
+            path = os.path.join(PROFILE_DIR, name)
+            with open(path) as f:
+                samples = sum(int(line.rsplit(' ', 1)[1]) for line in f if line.strip())
+            profiles.append({
+                'id': name[:-len('.collapsed')],
+                'size_bytes': os.path.getsize(path),
+                'samples': samples,
+                'approx_duration_ms': round(samples * PROFILE_INTERVAL * 1000),
+                'created': os.path.getmtime(path)
+            })
+
+    return jsonify({'profiles': profiles, 'directory': PROFILE_DIR})
+
+
+@profiling_bp.route('/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Download a profile in collapsed-stack format (input for flamegraph.pl or speedscope)"""
+    if not _valid_token(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'Invalid admin token'}), 403
+    if '/' in profile_id or profile_id.startswith('.'):
+        abort(404)
+    return send_from_directory(PROFILE_DIR, f"{profile_id}.collapsed", mimetype='text/plain')
@@ -0,0 +1,358 @@
+import os
+import io
+import re
+import time
+import zipfile
+import threading
+import subprocess
+import requests
+from urllib.parse import urlparse, unquote
+
+# Local sources are only served from these directories (os.pathsep separated); empty disables them
+LOCAL_REPO_ROOTS = [os.path.realpath(root) for root in os.getenv('LOCAL_REPO_ROOTS', '').split(os.pathsep) if root]
+# Bare mirrors of GitHub repositories laid out as <root>/<owner>/<repo>.git
+GIT_MIRROR_ROOT = os.getenv('GIT_MIRROR_ROOT') or None
+# Minimum seconds between incremental fetches of the same mirror
+MIRROR_FETCH_INTERVAL = int(os.getenv('MIRROR_FETCH_INTERVAL', '60'))
+GIT_TIMEOUT = int(os.getenv('GIT_TIMEOUT', '120'))
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com').rstrip('/')
+GITHUB_TOKEN = os.getenv('GITHUB_TOKEN') or None
+# Members larger than this are skipped without being decompressed (or read, for working trees)
+EXTRACT_MAX_FILE_SIZE = int(os.getenv('EXTRACT_MAX_FILE_SIZE', str(1024 * 1024)))
+# Downloads are streamed and abandoned past this size, so a huge archive can't exhaust memory
+REPO_MAX_ARCHIVE_BYTES = int(os.getenv('REPO_MAX_ARCHIVE_MB', '256')) * 1024 * 1024
+
+# Files extract_files can pick (see repo_utils._select_members), code first; local
+# archives only pack these, so binaries and assets don't count against the size cap
+CODE_EXTENSIONS = ('.py', '.js', '.ts', '.jsx', '.tsx', '.java', '.go', '.rb', '.php',
+                   '.html', '.css', '.scss', '.vue', '.rs', '.c', '.cpp', '.h', '.cs')
+DOC_EXTENSIONS = ('.md', '.txt', '.json', '.yml', '.yaml', '.xml')
+ARCHIVE_EXTENSIONS = CODE_EXTENSIONS + DOC_EXTENSIONS
+
+LOCAL_EXCLUDE_DIRS = {'.git', 'node_modules', 'venv', '.venv', '__pycache__', '.idea', '.vscode', 'build', 'dist', '.next'}
+REF_PATTERN = re.compile(r'^[A-Za-z0-9_][\w./-]*$')
+GITHUB_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+_last_fetch = {}
+_fetch_lock = threading.Lock()
+_head_etags = {}
+
+
+def _github_headers(**extra):
+    headers = dict(extra)
+    if GITHUB_TOKEN:
+        headers['Authorization'] = f"Bearer {GITHUB_TOKEN}"
+    return headers
+
+
+def _run_git(git_dir, *args):
+    result = subprocess.run(
+        ['git', f'--git-dir={git_dir}', *args],
+        capture_output=True,
+        timeout=GIT_TIMEOUT
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode('utf-8', 'ignore').strip() or f"git {args[0]} failed")
+    return result.stdout
+
+
+def _is_bare_repo(path):
+    return os.path.isfile(os.path.join(path, 'HEAD')) and os.path.isdir(os.path.join(path, 'objects'))
+
+
+def _allowed_local_path(path):
+    real_path = os.path.realpath(path)
+    return any(real_path == root or real_path.startswith(root + os.sep) for root in LOCAL_REPO_ROOTS)
+
+
+def _split_ref(location):
+    """Split an optional @ref suffix off the last path segment"""
+    head, _, last = location.rpartition('/')
+    if '@' in last:
+        last, ref = last.rsplit('@', 1)
+        return f"{head}/{last}" if head else last, ref
+    return location, None
+
+
+def update_mirror(git_dir):
+    """Incrementally fetch a bare mirror, at most once per MIRROR_FETCH_INTERVAL"""
+    with _fetch_lock:
+        if time.time() - _last_fetch.get(git_dir, 0) < MIRROR_FETCH_INTERVAL:
+            return
+        _last_fetch[git_dir] = time.time()
+
+    try:
+        _run_git(git_dir, 'fetch', '--prune', '--quiet', 'origin')
+    except (RuntimeError, subprocess.TimeoutExpired) as e:
+        # Serve the objects we already have rather than failing the request
+        print(f"Error fetching mirror {git_dir}: {str(e)}")
+
+
+def _too_large(max_bytes):
+    return f"Repository archive is larger than {max_bytes // (1024 * 1024)} MB"
+
+
+def _archive_extensions(git_dir, commit):
+    """
+    Extensions from ARCHIVE_EXTENSIONS present at a commit, and the total size of those files
+
+    git archive fails on a pathspec that matches nothing, so only present ones are passed.
+    """
+    extensions = set()
+    total = 0
+    for entry in _run_git(git_dir, 'ls-tree', '-r', '-l', '-z', commit).split(b'\0'):
+        if not entry:
+            continue
+        info, _, path = entry.decode('utf-8', 'surrogateescape').partition('\t')
+        size = info.split()[-1]
+        extension = next((ext for ext in ARCHIVE_EXTENSIONS if path.endswith(ext)), None)
+        if extension and size.isdigit():
+            extensions.add(extension)
+            total += int(size)
+    return sorted(extensions), total
+
+
+def archive_git_ref(git_dir, ref=None, fetch=True, name=None):
+    """
+    Read a ref from a local repository as ZIP content using `git archive`
+
+    Only files with ARCHIVE_EXTENSIONS are packed, and refs whose files add up to more
+    than REPO_MAX_ARCHIVE_BYTES are refused before anything is archived.
+
+    Returns:
+        tuple: (zip_content, error)
+    """
+    ref = ref or 'HEAD'
+    if not REF_PATTERN.match(ref):
+        return None, f"Invalid git ref: {ref}"
+
+    if fetch:
+        update_mirror(git_dir)
+
+    try:
+        commit = _run_git(git_dir, 'rev-parse', '--verify', '--quiet', f"{ref}^{{commit}}").decode().strip()
+        name = name or os.path.basename(git_dir.rstrip('/'))
+        if name.endswith('.git'):
+            name = name[:-4]
+
+        extensions, total = _archive_extensions(git_dir, commit)
+        if total > REPO_MAX_ARCHIVE_BYTES:
+            return None, _too_large(REPO_MAX_ARCHIVE_BYTES)
+        if not extensions:
+            return None, f"No source files found at {ref}"
+
+        # Same owner-repo-sha/ layout as a GitHub zipball
+        pathspecs = [f':(glob)**/*{extension}' for extension in extensions]
+        return _run_git(git_dir, 'archive', '--format=zip', f'--prefix={name}-{commit[:7]}/', commit, '--', *pathspecs), None
+    except subprocess.TimeoutExpired:
+        return None, "Timed out reading repository"
+    except RuntimeError as e:
+        return None, f"Failed to read repository at {ref}: {str(e)}"
+
+
+def archive_working_tree(path):
+    """
+    Pack a local working tree (without VCS and dependency directories) into uncompressed ZIP content
+
+    Only files with ARCHIVE_EXTENSIONS are packed, up to REPO_MAX_ARCHIVE_BYTES in total.
+
+    Returns:
+        tuple: (zip_content, error)
+    """
+    buffer = io.BytesIO()
+    prefix = os.path.basename(os.path.realpath(path).rstrip(os.sep))
+    total = 0
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zip_file:
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d not in LOCAL_EXCLUDE_DIRS)
+            for filename in sorted(files):
+                full_path = os.path.join(root, filename)
+                if not filename.endswith(ARCHIVE_EXTENSIONS):
+                    continue
+                if os.path.islink(full_path) or not os.path.isfile(full_path):
+                    continue
+                size = os.path.getsize(full_path)
+                if size > EXTRACT_MAX_FILE_SIZE:
+                    continue
+                total += size
+                if total > REPO_MAX_ARCHIVE_BYTES:
+                    return None, _too_large(REPO_MAX_ARCHIVE_BYTES)
+                arcname = f"{prefix}/{os.path.relpath(full_path, path).replace(os.sep, '/')}"
+                zip_file.write(full_path, arcname)
+
+    return buffer.getvalue(), None
+
+
+def fetch_local(location):
+    """Local working tree, or a local bare repository read at an optional @ref"""
+    path, ref = _split_ref(location)
+    if not LOCAL_REPO_ROOTS:
+        return None, "Local repositories are disabled (set LOCAL_REPO_ROOTS)"
+    if not _allowed_local_path(path) or not os.path.isdir(path):
+        return None, "Local repository path is not allowed or does not exist"
+
+    if _is_bare_repo(path):
+        return archive_git_ref(path, ref)
+    if ref:
+        return archive_git_ref(os.path.join(path, '.git'), ref, fetch=False, name=os.path.basename(os.path.realpath(path)))
+    return archive_working_tree(path)
+
+
+def _valid_github_name(name):
+    # Owner and repository names end up in mirror paths, so no separators or dot segments
+    return bool(GITHUB_NAME_PATTERN.match(name)) and name not in ('.', '..')
+
+
+def parse_github_url(repo_url):
+    """Split a GitHub URL into (owner, repo), dropping a trailing .git; None if it isn't one"""
+    parts = repo_url.rstrip('/').split('/')
+    if len(parts) < 5 or parts[2] != 'github.com':
+        return None
+    owner, repo = parts[3], parts[4]
+    if repo.endswith('.git'):
+        repo = repo[:-len('.git')]
+    if not (_valid_github_name(owner) and _valid_github_name(repo)):
+        return None
+    return owner, repo
+
+
+def fetch_github(owner, repo):
+    """GitHub repository, served from a local mirror when one exists, otherwise as a zipball"""
+    if not (_valid_github_name(owner) and _valid_github_name(repo)):
+        return None, "Invalid GitHub repository URL"
+
+    if GIT_MIRROR_ROOT:
+        mirror = os.path.join(GIT_MIRROR_ROOT, owner, f"{repo}.git")
+        if _is_bare_repo(mirror):
+            return archive_git_ref(mirror)
+
+    for branch in ('main', 'master'):
+        api_url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/zipball/{branch}"
+        response = requests.get(api_url, headers=_github_headers(), stream=True, timeout=GIT_TIMEOUT)
+        if response.status_code == 200:
+            break
+        response.close()
+    else:
+        return None, f"Failed to download repository: {response.status_code}"
+
+    return read_capped(response, REPO_MAX_ARCHIVE_BYTES)
+
+
+def read_capped(response, max_bytes):
+    """Read a streamed response body, giving up once it exceeds max_bytes"""
+    too_large = _too_large(max_bytes)
+    try:
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > max_bytes:
+            return None, too_large
+
+        chunks = []
+        total = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            total += len(chunk)
+            if total > max_bytes:
+                return None, too_large
+            chunks.append(chunk)
+        return b"".join(chunks), None
+    finally:
+        response.close()
+
+
+def get_github_head(owner, repo):
+    """
+    Current default-branch commit SHA of a GitHub repository
+
+    Uses the mirror when there is one, otherwise a conditional request for the bare SHA;
+    unchanged repositories answer 304, which GitHub does not count against the rate limit.
+    """
+    if not (_valid_github_name(owner) and _valid_github_name(repo)):
+        raise RuntimeError("Invalid GitHub repository URL")
+
+    if GIT_MIRROR_ROOT:
+        mirror = os.path.join(GIT_MIRROR_ROOT, owner, f"{repo}.git")
+        if _is_bare_repo(mirror):
+            update_mirror(mirror)
+            return _run_git(mirror, 'rev-parse', 'HEAD').decode().strip()
+
+    key = f"{owner}/{repo}"
+    cached = _head_etags.get(key)
+    headers = _github_headers(Accept='application/vnd.github.sha')
+    if cached:
+        headers['If-None-Match'] = cached[0]
+
+    response = requests.get(f"{GITHUB_API_URL}/repos/{owner}/{repo}/commits/HEAD", headers=headers, timeout=30)
+    if response.status_code == 304 and cached:
+        return cached[1]
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to read repository HEAD: {response.status_code}")
+
+    sha = response.text.strip()
+    if response.headers.get('ETag'):
+        _head_etags[key] = (response.headers['ETag'], sha)
+    return sha
+
+
+def get_head_sha(repo_url):
+    """
+    Commit SHA a repository URL currently resolves to, or None for sources without one
+
+    Raises:
+        RuntimeError: If the repository cannot be queried
+    """
+    if repo_url.startswith(('file://', 'git+file://', '/')):
+        location = unquote(urlparse(repo_url[len('git+'):] if repo_url.startswith('git+') else repo_url).path)
+        path, ref = _split_ref(location)
+        if not LOCAL_REPO_ROOTS or not _allowed_local_path(path):
+            raise RuntimeError("Local repository path is not allowed")
+        if ref and not REF_PATTERN.match(ref):
+            raise RuntimeError(f"Invalid git ref: {ref}")
+        if _is_bare_repo(path):
+            update_mirror(path)
+            return _run_git(path, 'rev-parse', f"{ref or 'HEAD'}^{{commit}}").decode().strip()
+        # Working trees change without commits, so they have no stable head to poll
+        return None
+
+    github_repo = parse_github_url(repo_url)
+    if github_repo is None:
+        raise RuntimeError("Invalid GitHub repository URL")
+    return get_github_head(*github_repo)
+
+
+def _github_handler(repo_url):
+    github_repo = parse_github_url(repo_url)
+    if github_repo is None:
+        return None, "Invalid GitHub repository URL"
+    return fetch_github(*github_repo)
+
+
+# (predicate, handler) pairs tried in order; the last entry catches everything else
+REPO_SOURCES = [
+    (lambda url: url.startswith('git+file://'), lambda url: fetch_local(unquote(urlparse(url[len('git+'):]).path))),
+    (lambda url: url.startswith('file://'), lambda url: fetch_local(unquote(urlparse(url).path))),
+    (lambda url: url.startswith('/'), fetch_local),
+    (lambda url: True, _github_handler)
+]
+
+
+def register_repo_source(predicate, handler):
+    """Add a repository source ahead of the built-in ones; handler(repo_url) returns (zip_content, error)"""
+    REPO_SOURCES.insert(0, (predicate, handler))
+
+
+def fetch_repo_archive(repo_url):
+    """
+    Resolve a repository URL to ZIP content for extract_files
+
+    Supported forms:
+        https://github.com/<owner>/<repo>       GitHub (local mirror under GIT_MIRROR_ROOT if present)
+        file:///path/to/tree or /path/to/tree   local working tree
+        file:///path/to/mirror.git[@ref]        local bare mirror at a ref (default HEAD)
+
+    Returns:
+        tuple: (zip_content, error)
+    """
+    for predicate, handler in REPO_SOURCES:
+        if predicate(repo_url):
+            return handler(repo_url)
+    return None, "Unsupported repository URL"
@@ -2,92 +2,150 @@ import os
 import re
 import json
 import io
-import tempfile
-import shutil
-import requests
+import codecs
 import zipfile
-import numpy as np
-import google.generativeai as genai
-import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.multioutput import MultiOutputClassifier
-from sklearn.ensemble import RandomForestClassifier
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from compaction import build_files_context
+from async_mode import cpu_executor, run_cpu
+from gemini_client import get_gemini_model
+from model_store import load_model
+from repo_sources import fetch_repo_archive, EXTRACT_MAX_FILE_SIZE, CODE_EXTENSIONS, DOC_EXTENSIONS
+
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', '4'))
+SNIFF_BYTES = 8192
+# Admission estimates: copies of the decoded text alive at once, plus fixed per-request overhead
+DECODED_COPIES = 3
+REQUEST_BASE_MEMORY = 2 * 1024 * 1024
 
 def download_repo(repo_url):
-    """Download a GitHub repository as a ZIP file"""
-    parts = repo_url.rstrip('/').split('/')
-    if len(parts) < 5 or parts[2] != 'github.com':
-        return None, "Invalid GitHub repository URL"
+    """Download a repository as ZIP content from GitHub, a local mirror or a local working tree"""
+    return fetch_repo_archive(repo_url)
+
+def _select_members(zip_file):
+    """Pick candidate members from the archive, main code files first"""
+    all_files = [file_info for file_info in zip_file.infolist() 
+                 if not file_info.is_dir() and not file_info.filename.startswith('__')]
     
-    owner = parts[3]
-    repo = parts[4]
+    gitignore_patterns = []
+    try:
+        if '.gitignore' in zip_file.namelist():
+            with zip_file.open('.gitignore') as gitignore_file:
+                gitignore_patterns = [line.strip().decode('utf-8', 'ignore') for line in gitignore_file.readlines() if line.strip()]
+    except Exception as e:
+        print(f"Error reading .gitignore: {str(e)}")
     
-    api_url = f"https://api.github.com/repos/{owner}/{repo}/zipball/main"
+    exclude_dirs = gitignore_patterns + [
+        '/node_modules/', '/venv/', '/__pycache__/', '/.vscode/', '/.idea/', '/build/', '/dist/', '/.next/'
+    ]
+    
+    filtered_files = [info for info in all_files
+                      if not any(excl_dir in info.filename for excl_dir in exclude_dirs)]
+
+    main_code_files = [info for info in filtered_files 
+                      if info.filename.endswith(CODE_EXTENSIONS)]
     
-    response = requests.get(api_url)
-    if response.status_code != 200:
-        api_url = f"https://api.github.com/repos/{owner}/{repo}/zipball/master"
-        response = requests.get(api_url)
-        if response.status_code != 200:
-            return None, f"Failed to download repository: {response.status_code}"
+    other_useful_files = [info for info in filtered_files 
+                         if info.filename.endswith(DOC_EXTENSIONS)]
     
-    return response.content, None
+    return main_code_files + other_useful_files
 
-def extract_files(zip_content, max_files=20):
-    """Extract files from the ZIP content with intelligent directory prioritization"""
-    temp_dir = tempfile.mkdtemp()
-    file_contents = {}
+def _read_text_member(zip_file, file_info):
+    """Decompress and decode one member, or return None if it looks binary"""
+    with zip_file.open(file_info) as member:
+        # Sniff a prefix first so binaries are rejected without inflating the whole member
+        prefix = member.read(SNIFF_BYTES)
+        if b'\0' in prefix:
+            return None
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        except UnicodeDecodeError:
+            return None
+        data = prefix + member.read()
     
     try:
-        zip_file = zipfile.ZipFile(io.BytesIO(zip_content))
-        
-        all_files = [(file_info.filename, file_info.file_size) 
-                     for file_info in zip_file.infolist() 
-                     if not file_info.is_dir() and not file_info.filename.startswith('__')]
-        
-        gitignore_patterns = []
-        try:
-            if '.gitignore' in zip_file.namelist():
-                with zip_file.open('.gitignore') as gitignore_file:
-                    gitignore_patterns = [line.strip() for line in gitignore_file.readlines() if line.strip()]
-        except Exception as e:
-            print(f"Error reading .gitignore: {str(e)}")
-        
-        exclude_dirs = gitignore_patterns + [
-            '/node_modules/', '/venv/', '/__pycache__/', '/.vscode/', '/.idea/', '/build/', '/dist/', '/.next/'
-        ]
-        
-        filtered_files = [(name, size) for name, size in all_files
-                         if not any(excl_dir in name for excl_dir in exclude_dirs)]
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
 
-        code_extensions = ['.py', '.js', '.ts', '.jsx', '.tsx', '.java', '.go', '.rb', '.php', 
-                          '.html', '.css', '.scss', '.vue', '.rs', '.c', '.cpp', '.h', '.cs']
-        
-        main_code_files = [(name, size) for name, size in filtered_files 
-                          if any(name.endswith(ext) for ext in code_extensions)]
-        
-        other_useful_files = [(name, size) for name, size in filtered_files 
-                             if name.endswith(('.md', '.txt', '.json', '.yml', '.yaml', '.xml')) 
-                             and not any(name.endswith(ext) for ext in code_extensions)]
-        
-        sorted_files = main_code_files + other_useful_files
-        
-        count = 0
-        for filename, _ in sorted_files:
+def iter_extract_files(zip_content, max_files=20, max_file_size=None, workers=None):
+    """
+    Yield (filename, content) pairs from the ZIP content in priority order as they are decoded
+
+    Members over max_file_size are skipped from the archive index alone. The rest are
+    decompressed and decoded across a thread pool (zlib releases the GIL), a bounded
+    window ahead of the consumer, so downstream stages can start before extraction ends.
+
+    In async mode the shared native-thread pool is used instead of a private one (whose
+    threads would be greenlets), so call this from the event loop rather than via run_cpu.
+    """
+    max_file_size = max_file_size or EXTRACT_MAX_FILE_SIZE
+    workers = workers or EXTRACT_WORKERS
+    executor = cpu_executor()
+    
+    zip_file = zipfile.ZipFile(io.BytesIO(zip_content))
+    candidates = [info for info in _select_members(zip_file) if info.file_size <= max_file_size]
+    
+    count = 0
+    if workers <= 1 and executor is None:
+        for file_info in candidates:
             if count >= max_files:
                 break
-                
-            try:
-                content = zip_file.read(filename).decode('utf-8')
-                file_contents[filename] = content
+            content = _read_text_member(zip_file, file_info)
+            if content is not None:
                 count += 1
-            except UnicodeDecodeError:
-                pass
+                yield file_info.filename, content
+        return
+    
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    remaining = iter(candidates)
+    
+    def fill():
+        while len(pending) < workers * 2:
+            file_info = next(remaining, None)
+            if file_info is None:
+                return
+            pending.append((file_info.filename, executor.submit(_read_text_member, zip_file, file_info)))
     
+    try:
+        fill()
+        while pending and count < max_files:
+            filename, future = pending.popleft()
+            content = future.result()
+            fill()
+            if content is not None:
+                count += 1
+                yield filename, content
     finally:
-        shutil.rmtree(temp_dir)
+        for _, future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
+
+def estimate_processing_memory(zip_content, max_files=20, max_file_size=None):
+    """
+    Estimate the peak bytes a request holds while processing this archive
+
+    Counts the archive itself plus the decoded text of the files extract_files would
+    pick, which is held several times over: the file_contents dict, the concatenated
+    all_content string and the compacted prompt.
+    """
+    max_file_size = max_file_size or EXTRACT_MAX_FILE_SIZE
+    try:
+        zip_file = zipfile.ZipFile(io.BytesIO(zip_content))
+        candidates = [info for info in _select_members(zip_file) if info.file_size <= max_file_size]
+    except zipfile.BadZipFile:
+        return len(zip_content) + REQUEST_BASE_MEMORY
     
-    return file_contents
+    decoded = sum(info.file_size for info in candidates[:max_files])
+    return len(zip_content) + decoded * DECODED_COPIES + REQUEST_BASE_MEMORY
+
+def extract_files(zip_content, max_files=20):
+    """Extract files from the ZIP content with intelligent directory prioritization"""
+    return dict(iter_extract_files(zip_content, max_files=max_files))
 
 def extract_repo_features(file_contents):
     """Extract features from repository content for ML models"""
@@ -109,17 +167,15 @@ def extract_repo_features(file_contents):
     
     return features, all_content
 
-def generate_questions_with_gemini(file_contents):
+def generate_questions_with_gemini(file_contents, compaction_level="skeleton", max_chars=2000):
     """Use Gemini API to generate questions about the repository"""
-    context = "I have a GitHub repository with the following files:\n\n"
-    
-    for filename, content in file_contents.items():
-        context += f"File: {filename}\n"
-        
-        if len(content) > 2000:
-            content = content[:2000] + "\n... (content truncated)"
-            
-        context += f"Content:\n{content}\n\n"
+    context = run_cpu(
+        build_files_context,
+        "I have a GitHub repository with the following files:\n\n",
+        file_contents,
+        max_chars,
+        compaction_level
+    )
     
     prompt = f"""{context}
 
@@ -145,7 +201,7 @@ Format your response as a JSON array of objects with the following structure:
 Ensure the JSON is properly formatted and can be parsed by a JSON parser.
 """
     
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    model = get_gemini_model()
     response = model.generate_content(prompt)
     
     try:
@@ -173,8 +229,8 @@ def classify_question_difficulty(question_text, repo_content, question_context="
     full_text = f"{question_text} {question_context} {repo_content[:5000]}"
     
     if vectorizer_exists and model_exists:
-        vectorizer = joblib.load(vectorizer_path)
-        difficulty_model = joblib.load(model_path)
+        vectorizer = load_model(vectorizer_path)
+        difficulty_model = load_model(model_path)
         
         features = vectorizer.transform([full_text])
         
@@ -203,7 +259,8 @@ def classify_question_companies(question_text, repo_features, question_context="
     model_exists = model_path and os.path.exists(model_path)
     
     if model_exists:
-        company_model = joblib.load(model_path)
+        import numpy as np
+        company_model = load_model(model_path)
         
         feature_vector = np.array([
             repo_features['python_count'],
@@ -257,6 +314,12 @@ def classify_question_companies(question_text, repo_features, question_context="
 
 def train_models(training_data, model_dir, difficulty_levels, company_types):
     """Train and save classification models using collected training data"""
+    import numpy as np
+    import joblib
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.multioutput import MultiOutputClassifier
+    from sklearn.ensemble import RandomForestClassifier
+    
     X_texts = [item['question'] + ' ' + item['context'] for item in training_data]
     y_difficulty = [difficulty_levels.index(item['difficulty']) for item in training_data]
     
@@ -0,0 +1,285 @@
+import re
+import json
+import hashlib
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from compaction import compact_file_cached
+from analysis_cache import ANALYSIS_CACHE, archive_prefix, blob_hash
+from gemini_client import get_gemini_model
+
+REVIEW_SECTIONS = {
+    'code_smells': ('file', 'description'),
+    'architectural_suggestions': ('type', 'description'),
+    'performance_recommendations': ('file', 'description'),
+    'best_practices_feedback': ('category', 'description')
+}
+QUALITY_RANKING = ["Needs Improvement", "Average", "Good"]
+
+# Rough characters-per-token ratio used to turn a token budget into a character budget
+CHARS_PER_TOKEN = 4
+
+
+def parse_json_response(text):
+    """Parse JSON from a Gemini response, falling back to a ```json fenced block"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        json_match = re.search(r'```json\s*([\s\S]*?)\s*```', text)
+        if json_match:
+            try:
+                return json.loads(json_match.group(1))
+            except json.JSONDecodeError:
+                return None
+        return None
+
+
+def build_review_prompt(context):
+    """Build the code review prompt for a block of repository file context"""
+    return f"""{context}
+
+Perform a comprehensive code review focusing on:
+
+1. Code Smells and Anti-Patterns:
+   - Identify code duplication
+   - Detect overly complex methods/functions
+   - Look for long methods that violate Single Responsibility Principle
+   - Find potential performance bottlenecks
+   - Identify unnecessary code or dead code
+
+2. Architectural Improvements:
+   - Suggest better design patterns
+   - Identify potential refactoring opportunities
+   - Recommend modularization strategies
+   - Suggest ways to improve code organization
+
+3. Best Practices and Standards:
+   - Check adherence to language-specific coding standards
+   - Look for potential security vulnerabilities
+   - Identify areas for improved error handling
+   - Recommend more efficient algorithms or data structures
+
+4. Potential Optimizations:
+   - Suggest performance improvements
+   - Identify memory-inefficient code
+   - Recommend more pythonic or idiomatic solutions
+
+Provide a structured JSON response with the following format:
+```json
+{{
+    "overall_code_quality": "Good/Average/Needs Improvement",
+    "code_smells": [
+        {{
+            "file": "filename.py",
+            "line_start": 10,
+            "line_end": 25,
+            "description": "Detailed explanation of the code smell",
+            "severity": "Low/Medium/High",
+            "suggestion": "Specific recommendation for improvement"
+        }}
+    ],
+    "architectural_suggestions": [
+        {{
+            "type": "Refactoring/Design Pattern/Modularization",
+            "description": "Detailed suggestion for improvement",
+            "potential_impact": "Brief explanation of expected benefits"
+        }}
+    ],
+    "performance_recommendations": [
+        {{
+            "file": "filename.py",
+            "description": "Performance improvement opportunity",
+            "suggested_optimization": "Specific code or approach to optimize"
+        }}
+    ],
+    "best_practices_feedback": [
+        {{
+            "category": "Error Handling/Security/Coding Standards",
+            "description": "Specific feedback and recommendations"
+        }}
+    ]
+}}
+```
+
+Ensure the response is comprehensive yet concise, focusing on actionable insights.
+Prioritize suggestions that can significantly improve code quality, maintainability, and performance.
+"""
+
+
+def _is_shard_boundary(path):
+    """Content-independent shard boundary so a changed file doesn't reshuffle every later shard"""
+    return int(hashlib.md5(path.encode('utf-8')).hexdigest(), 16) % 4 == 0
+
+
+def shard_files(file_contents, shard_token_budget, max_chars_per_file=3000, compaction_level="blank"):
+    """
+    Group compacted files into shards that each fit within a token budget
+
+    Shards close at name-based boundary files once half full, so editing one file
+    only changes the shard it belongs to and leaves the others cacheable.
+
+    Args:
+        file_contents (dict): Mapping of filename to raw file text
+        shard_token_budget (int): Approximate prompt tokens allowed per shard
+        max_chars_per_file (int): Character budget for a single file
+        compaction_level (str): Compaction level passed to compact_file
+
+    Returns:
+        list: Shards, each a list of (path, blob hash, compacted content) tuples
+    """
+    shard_chars = shard_token_budget * CHARS_PER_TOKEN
+    prefix = archive_prefix(list(file_contents))
+    shards = []
+    current, current_size = [], 0
+
+    for filename in sorted(file_contents):
+        content = file_contents[filename]
+        path = filename[len(prefix):]
+        blob = blob_hash(content)
+        compacted = compact_file_cached(filename, content, max_chars_per_file, compaction_level)
+        if not compacted:
+            continue
+        size = len(path) + len(compacted)
+        if current and (current_size + size > shard_chars
+                        or (current_size >= shard_chars // 2 and _is_shard_boundary(path))):
+            shards.append(current)
+            current, current_size = [], 0
+        current.append((path, blob, compacted))
+        current_size += size
+
+    if current:
+        shards.append(current)
+    return shards
+
+
+def _shard_cache_key(shard, compaction_level):
+    return hashlib.sha256(json.dumps(
+        [compaction_level] + [[path, blob] for path, blob, _ in shard]
+    ).encode('utf-8')).hexdigest()
+
+
+def review_shard(shard):
+    """Run the review prompt for a single shard, returning parsed JSON or None"""
+    context = "Repository Code Review Analysis:\n\n"
+    for path, _, content in shard:
+        context += f"File: {path}\nContent:\n{content}\n\n"
+
+    model = get_gemini_model()
+    response = model.generate_content(build_review_prompt(context))
+    review_data = parse_json_response(response.text)
+    return review_data if isinstance(review_data, dict) else None
+
+
+def review_shard_cached(shard, compaction_level):
+    """Review a shard, reusing findings when the same files at the same blobs were reviewed before"""
+    key = _shard_cache_key(shard, compaction_level)
+    review_data = ANALYSIS_CACHE.get('review_shard', key)
+    if review_data is not None:
+        return review_data, True
+
+    review_data = review_shard(shard)
+    if review_data:
+        ANALYSIS_CACHE.set('review_shard', key, review_data)
+    return review_data, False
+
+
+def _dedupe_key(item, fields):
+    if not isinstance(item, dict):
+        return json.dumps(item, sort_keys=True)
+    return tuple(" ".join(str(item.get(field, '')).lower().split()) for field in fields)
+
+
+def merge_reviews(reviews):
+    """Merge per-shard review results into the single /review response schema"""
+    merged = {section: [] for section in REVIEW_SECTIONS}
+    seen = {section: set() for section in REVIEW_SECTIONS}
+    qualities = []
+
+    for review in reviews:
+        quality = review.get('overall_code_quality')
+        if quality in QUALITY_RANKING:
+            qualities.append(quality)
+
+        for section, fields in REVIEW_SECTIONS.items():
+            for item in review.get(section) or []:
+                key = _dedupe_key(item, fields)
+                if key in seen[section]:
+                    continue
+                seen[section].add(key)
+                merged[section].append(item)
+
+    if qualities:
+        # Most common rating wins, ties go to the worse rating
+        counts = Counter(qualities)
+        merged['overall_code_quality'] = max(counts, key=lambda q: (counts[q], -QUALITY_RANKING.index(q)))
+    else:
+        merged['overall_code_quality'] = "Average"
+
+    return merged
+
+
+def summarize_review(merged):
+    """Consolidate cross-cutting sections of a merged review with one small LLM call"""
+    sections = {
+        'architectural_suggestions': merged['architectural_suggestions'],
+        'best_practices_feedback': merged['best_practices_feedback']
+    }
+    prompt = f"""The following code review findings were produced independently for different parts of one repository:
+
+{json.dumps(sections, indent=2)}
+
+Merge findings that describe the same issue, drop near-duplicates and keep the most actionable wording.
+Return JSON with exactly the keys "architectural_suggestions" and "best_practices_feedback", using the same item structure.
+"""
+    model = get_gemini_model()
+    response = model.generate_content(prompt)
+    summary = parse_json_response(response.text)
+
+    if isinstance(summary, dict):
+        for section in sections:
+            if isinstance(summary.get(section), list):
+                merged[section] = summary[section]
+    return merged
+
+
+def sharded_review(file_contents, shard_token_budget=6000, max_workers=8, compaction_level="blank", summarize=False):
+    """
+    Review a repository by reviewing token-budgeted shards in parallel and merging the results
+
+    Returns:
+        tuple: (review_data, shard_count, failed_shard_count, cached_shard_count)
+    """
+    shards = shard_files(file_contents, shard_token_budget, compaction_level=compaction_level)
+    if not shards:
+        return None, 0, 0, 0
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(shards))) as executor:
+        # Each shard runs in a copy of this context so LLM usage tracking sees its calls
+        futures = [
+            executor.submit(contextvars.copy_context().run, review_shard_cached, shard, compaction_level)
+            for shard in shards
+        ]
+        reviews = []
+        cached_shards = 0
+        for future in futures:
+            try:
+                review_data, from_cache = future.result()
+                reviews.append(review_data)
+                cached_shards += from_cache
+            except Exception as e:
+                print(f"Error reviewing shard: {str(e)}")
+                reviews.append(None)
+
+    successful = [review for review in reviews if review]
+    failed = len(reviews) - len(successful)
+    if not successful:
+        return None, len(shards), failed, cached_shards
+
+    merged = merge_reviews(successful)
+    if summarize and len(successful) > 1:
+        try:
+            merged = summarize_review(merged)
+        except Exception as e:
+            print(f"Error summarizing review: {str(e)}")
+
+    return merged, len(shards), failed, cached_shards
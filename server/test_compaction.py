@@ -0,0 +1,51 @@
+from compaction import strip_noise, compact_file
+
+
+def test_js_regex_literal_with_quote_keeps_following_strings():
+    source = "const re = /'/;\nconst u = 'http://a.com/x';"
+    assert strip_noise('a.js', source) == source
+
+
+def test_js_regex_literal_with_slashes_and_comment():
+    source = "const r = /[/]\\/x/g.test(y); // trailing\nconst z = a / b / c;"
+    assert strip_noise('a.js', source) == "const r = /[/]\\/x/g.test(y);\nconst z = a / b / c;"
+
+
+def test_js_comments_are_removed_outside_strings():
+    source = "// header\nconst s = \"// not a comment\"; /* block */\nlet t = `a\n// inside template`;"
+    assert strip_noise('a.js', source) == "const s = \"// not a comment\";\nlet t = `a\n// inside template`;"
+
+
+def test_css_url_is_not_treated_as_comment():
+    source = "a { background: url(http://example.com/x.png); color: red; } /* note */"
+    assert strip_noise('a.css', source) == "a { background: url(http://example.com/x.png); color: red; }"
+
+
+def test_rust_lifetimes_do_not_open_strings():
+    source = "fn f<'a>(x: &'a str) -> &'a str { x } // comment\nconst URL: &str = \"http://a.com\"; // c\nlet c = '/';"
+    assert strip_noise('a.rs', source) == "fn f<'a>(x: &'a str) -> &'a str { x }\nconst URL: &str = \"http://a.com\";\nlet c = '/';"
+
+
+def test_c_char_literal_with_double_quote():
+    source = "char c = '\"'; // comment\nint x = 1;"
+    assert strip_noise('a.c', source) == "char c = '\"';\nint x = 1;"
+
+
+def test_blank_level_keeps_line_numbers():
+    source = "import os\n\n# comment\ndef f():\n    '''doc'''\n    return 1  # trailing\n"
+    compacted = compact_file('a.py', source, 3000, level="blank")
+    assert compacted.splitlines() == ["import os", "", "", "def f():", "    '''doc'''", "    return 1"]
+
+
+def test_blank_level_keeps_lines_of_block_and_markup_comments():
+    js = "/**\n * License\n */\nfunction f() {}\n"
+    assert compact_file('a.js', js, 3000, level="blank").splitlines()[3] == "function f() {}"
+    vue = "<!--\nnote\n-->\n<template></template>"
+    assert compact_file('a.vue', vue, 3000, level="blank").splitlines()[3] == "<template></template>"
+
+
+def test_vue_and_php_markup_is_not_treated_as_comment():
+    vue = "<template><a>see https://x.com</a></template>\n<script>\n// note\nconst u = 'https://y.com';\n</script>"
+    assert strip_noise('t.vue', vue) == "<template><a>see https://x.com</a></template>\n<script>\nconst u = 'https://y.com';\n</script>"
+    php = "<a href=\"https://x.com\">x</a>\n<?php // note\necho 'hi'; ?>\n<p>//</p>"
+    assert strip_noise('t.php', php) == "<a href=\"https://x.com\">x</a>\n<?php\necho 'hi'; ?>\n<p>//</p>"